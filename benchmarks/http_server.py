@@ -0,0 +1,162 @@
+import os
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+class _TokenBucket:
+    """所有连接共享的带宽上限（字节/秒）"""
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def consume(self, size: int):
+        with self.lock:
+            now = time.monotonic()
+            self.next_time = max(self.next_time, now) + size / self.rate
+            delay = self.next_time - now
+        if delay > 0:
+            time.sleep(delay)
+
+class FakeInstallerServer:
+    """在本机提供安装包下载的HTTP服务器，支持Range、If-Range、限速和故障注入
+
+    bandwidth：所有连接共享的带宽上限（字节/秒）
+    connection_bandwidth：单个连接的带宽上限，模拟按连接限速的CDN
+    error_rate：请求直接返回503的概率（客户端会按退避策略重试）
+    drop_rate：响应体传输到随机位置时断开连接的概率（客户端需要续传）
+    latency：每个请求返回响应头前的延迟（秒）
+    """
+
+    def __init__(self, directory: Path, bandwidth: Optional[int] = None,
+                 connection_bandwidth: Optional[int] = None, error_rate: float = 0.0,
+                 drop_rate: float = 0.0, latency: float = 0.0, seed: int = 0):
+        self.directory = Path(directory)
+        self.bucket = _TokenBucket(bandwidth) if bandwidth else None
+        self.connection_bandwidth = connection_bandwidth
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.latency = latency
+        self.random = random.Random(f'faults:{seed}')
+        self.random_lock = threading.Lock()
+        self.counters = {'requests': 0, 'errors': 0, 'drops': 0, 'bytes': 0}
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    def url(self, name: str) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_port}/{name}'
+
+    def start(self) -> 'FakeInstallerServer':
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def _roll(self, probability: float) -> bool:
+        if not probability:
+            return False
+        with self.random_lock:
+            return self.random.random() < probability
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                self._serve(send_body=False)
+
+            def do_GET(self):
+                self._serve(send_body=True)
+
+            def _serve(self, send_body: bool):
+                server.counters['requests'] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+
+                path = server.directory / os.path.basename(self.path)
+                if not path.is_file():
+                    self.send_error(404)
+                    return
+                if server._roll(server.error_rate):
+                    server.counters['errors'] += 1
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                stat = path.stat()
+                size = stat.st_size
+                etag = f'"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{size:x}"'
+                start, end = 0, size - 1
+                partial = False
+
+                range_header = self.headers.get('Range')
+                if_range = self.headers.get('If-Range')
+                if range_header and (not if_range or if_range == etag):
+                    first, _, last = range_header.replace('bytes=', '').partition('-')
+                    start = int(first)
+                    end = min(int(last), size - 1) if last else size - 1
+                    partial = True
+
+                self.send_response(206 if partial else 200)
+                self.send_header('Content-Length', str(end - start + 1))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('ETag', etag)
+                if partial:
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+                self.end_headers()
+                if not send_body:
+                    return
+
+                # 故障注入：在响应体的随机位置断开连接
+                drop_at = None
+                if server._roll(server.drop_rate):
+                    with server.random_lock:
+                        drop_at = start + server.random.randrange(end - start + 1)
+
+                buckets = [server.bucket] if server.bucket else []
+                if server.connection_bandwidth:
+                    buckets.append(_TokenBucket(server.connection_bandwidth))
+
+                with open(path, 'rb') as f:
+                    f.seek(start)
+                    position = start
+                    while position <= end:
+                        block = f.read(min(64 * 1024, end + 1 - position))
+                        if drop_at is not None and position + len(block) > drop_at:
+                            server.counters['drops'] += 1
+                            self.close_connection = True
+                            try:
+                                self.wfile.write(block[:drop_at - position])
+                            except (BrokenPipeError, ConnectionResetError):
+                                pass
+                            return
+                        for bucket in buckets:
+                            bucket.consume(len(block))
+                        try:
+                            self.wfile.write(block)
+                        except (BrokenPipeError, ConnectionResetError):
+                            return
+                        position += len(block)
+                        server.counters['bytes'] += len(block)
+
+        return Handler
@@ -0,0 +1,298 @@
+"""DeepLearningMate 性能基准
+
+在临时目录中生成合成的CUDA工具包和安装包，在本机HTTP服务器上提供下载，
+对版本切换、事务快照/回滚、缓存备份/恢复和下载计时，结果输出为JSON，
+可以与其他提交的结果对比。不需要GPU、root权限或网络。
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --compare baseline.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import click
+
+from .synthetic import MB, generate_toolkit, generate_installer
+from .http_server import FakeInstallerServer
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+VERSIONS = ('12.1', '12.2')
+
+class BenchmarkRun:
+    """在可重定位的根目录下准备环境并依次运行各项基准"""
+
+    def __init__(self, root: Path, repeat: int, size_scale: float, count_scale: float,
+                 installer_size: int, bandwidth: Optional[int],
+                 connection_bandwidth: Optional[int], seed: int):
+        self.root = root
+        self.repeat = repeat
+        self.size_scale = size_scale
+        self.count_scale = count_scale
+        self.installer_size = installer_size
+        self.bandwidth = bandwidth
+        self.connection_bandwidth = connection_bandwidth
+        self.seed = seed
+
+        self.home = root / 'home'
+        self.install_base = root / 'usr_local'
+        self.results: Dict[str, Dict] = {}
+        self.toolkits: Dict[str, Dict] = {}
+
+    def prepare(self):
+        """生成合成工具包，并把HOME指向根目录，所有状态文件都写在根目录下"""
+        self.home.mkdir(parents=True)
+        self.install_base.mkdir(parents=True)
+        os.environ['HOME'] = str(self.home)
+        # 本机服务器不能经过代理
+        os.environ['NO_PROXY'] = os.environ['no_proxy'] = '127.0.0.1,localhost'
+
+        for version in VERSIONS:
+            started = time.perf_counter()
+            self.toolkits[version] = generate_toolkit(
+                self.install_base, version, self.size_scale, self.count_scale, seed=self.seed)
+            print(f"🧪 生成合成工具包 cuda-{version}: {self.toolkits[version]['files']} 个文件, "
+                  f"{self.toolkits[version]['bytes'] / MB:.1f} MB, "
+                  f"{time.perf_counter() - started:.1f}s", file=sys.stderr)
+        os.symlink(f'cuda-{VERSIONS[0]}', self.install_base / 'cuda')
+
+    def record(self, name: str, runs: List[float], **info):
+        result = {
+            'runs': [round(seconds, 4) for seconds in runs],
+            'median': round(statistics.median(runs), 4),
+            'min': round(min(runs), 4)
+        }
+        result.update(info)
+        if info.get('bytes') and result['median']:
+            result['mb_per_s'] = round(info['bytes'] / MB / result['median'], 1)
+        self.results[name] = result
+        print(f"⏱️ {name}: {result['median']:.3f}s (中位数, {len(runs)} 次)", file=sys.stderr)
+
+    def bench_snapshot_rollback(self):
+        """事务快照（完整/增量）、提交和回滚"""
+        from src.transaction_manager import TransactionManager
+
+        manager = TransactionManager()
+        tree = self.install_base / f'cuda-{VERSIONS[0]}'
+        stats = self.toolkits[VERSIONS[0]]
+
+        snapshot_runs, rollback_runs = [], []
+        for iteration in range(self.repeat):
+            started = time.perf_counter()
+            transaction_id = manager._create_transaction('bench_rollback', [tree])
+            snapshot_runs.append(time.perf_counter() - started)
+
+            self._modify_tree(tree, iteration)
+            started = time.perf_counter()
+            manager._rollback_transaction(transaction_id)
+            rollback_runs.append(time.perf_counter() - started)
+            manager._cleanup_transaction(transaction_id)
+        self.record('snapshot_full', snapshot_runs, files=stats['files'], bytes=stats['bytes'])
+        self.record('rollback', rollback_runs, files=stats['files'], bytes=stats['bytes'])
+
+        # 提交后的快照以上一次快照为父快照，只保存变化的文件
+        commit_runs = []
+        for iteration in range(self.repeat + 1):
+            started = time.perf_counter()
+            with manager.transaction('bench_commit', [tree]):
+                self._modify_tree(tree, iteration)
+            commit_runs.append(time.perf_counter() - started)
+        self.record('snapshot_incremental_commit', commit_runs[1:], files=stats['files'])
+
+    def bench_switch(self):
+        """版本切换；每个版本第一次被切走时包含把它备份到缓存"""
+        from src.version_manager import CudaVersionManager
+
+        manager = CudaVersionManager(install_base=self.install_base)
+        runs = []
+        for iteration in range(self.repeat * 2 + 1):
+            target = VERSIONS[(iteration + 1) % 2]
+            started = time.perf_counter()
+            if not manager.switch_cuda_version(target):
+                raise RuntimeError(f"切换到CUDA {target}失败")
+            runs.append(time.perf_counter() - started)
+        self.record('switch_with_cache_backup', runs[:2],
+                    bytes=self.toolkits[VERSIONS[0]]['bytes'])
+        self.record('switch', runs[2:])
+
+    def bench_cache(self):
+        """分块缓存的备份（冷/去重）和恢复"""
+        from src.chunk_store import ChunkStore
+
+        backup_runs, dedup_runs, restore_runs = [], [], []
+        stored = {}
+        for iteration in range(self.repeat):
+            store = ChunkStore(self.root / f'bench_cache_{iteration}')
+            for version, runs in zip(VERSIONS, (backup_runs, dedup_runs)):
+                started = time.perf_counter()
+                stored[version] = store.store(version, self.install_base / f'cuda-{version}')
+                runs.append(time.perf_counter() - started)
+
+            target = self.root / f'bench_restore_{iteration}'
+            started = time.perf_counter()
+            store.restore(VERSIONS[0], target)
+            restore_runs.append(time.perf_counter() - started)
+            shutil.rmtree(target)
+            shutil.rmtree(store.root)
+
+        first, second = (stored[version] for version in VERSIONS)
+        self.record('cache_backup', backup_runs, files=first['files'], bytes=first['bytes'],
+                    stored_bytes=first['stored_bytes'])
+        self.record('cache_backup_dedup', dedup_runs, files=second['files'],
+                    bytes=second['bytes'], stored_bytes=second['stored_bytes'])
+        self.record('cache_restore', restore_runs, files=first['files'], bytes=first['bytes'])
+
+    def bench_download(self):
+        """从本机服务器下载安装包：单连接、多连接以及故障注入下的多连接"""
+        from src.downloader import CudaDownloader
+
+        served = self.root / 'served'
+        name = f'cuda_{VERSIONS[0]}_linux.run'
+        digest = generate_installer(served / name, self.installer_size, self.seed)
+
+        scenarios = [
+            ('download_1_connection', 1, {}),
+            ('download_4_connections', 4, {}),
+            ('download_4_connections_faulty', 4, {'error_rate': 0.25, 'drop_rate': 0.25})
+        ]
+        for label, connections, faults in scenarios:
+            runs = []
+            with FakeInstallerServer(served, bandwidth=self.bandwidth,
+                                     connection_bandwidth=self.connection_bandwidth,
+                                     seed=self.seed, **faults) as server:
+                for iteration in range(self.repeat):
+                    downloader = CudaDownloader(connections=connections, mirror='official')
+                    # 让下载器只使用本机服务器
+                    catalog = {VERSIONS[0]: {'bench': server.url(name)}}
+                    downloader.mirrors = {'official': catalog}
+                    downloader.current_urls = catalog
+
+                    download_dir = self.root / f'{label}_{iteration}'
+                    started = time.perf_counter()
+                    path = downloader.download_cuda(VERSIONS[0], 'bench', download_dir)
+                    runs.append(time.perf_counter() - started)
+                    if path is None or _sha256(path) != digest:
+                        raise RuntimeError(f"{label}: 下载结果与源文件不一致")
+                    shutil.rmtree(download_dir)
+                counters = dict(server.counters)
+            self.record(label, runs, bytes=self.installer_size, connections=connections,
+                        server=counters)
+
+    def _modify_tree(self, tree: Path, iteration: int):
+        """模拟安装程序：替换约5%的库文件并新增一个文件"""
+        lib = tree / 'targets' / 'x86_64-linux' / 'lib'
+        files = sorted(entry for entry in lib.iterdir() if entry.is_file() and not entry.is_symlink())
+        for path in files[iteration % 20::20]:
+            data = path.read_bytes()
+            path.unlink()
+            path.write_bytes(data[::-1])
+        (tree / f'bench_{iteration}.txt').write_text(str(iteration))
+
+def _sha256(path: Path) -> str:
+    import hashlib
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(8 * MB), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def _git_revision() -> Dict:
+    def git(*args):
+        result = subprocess.run(['git', *args], cwd=REPO_ROOT, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+    return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(git('status', '--porcelain', 'src'))}
+
+def _compare(results: Dict, baseline_file: Path):
+    """与基线结果对比中位数"""
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    print(f"\n📊 对比基线 {baseline['meta'].get('commit', '')[:10]}:", file=sys.stderr)
+    for name, result in results['results'].items():
+        before = baseline['results'].get(name)
+        if not before:
+            continue
+        ratio = result['median'] / before['median'] if before['median'] else float('inf')
+        flag = '🔺' if ratio > 1.1 else '🔻' if ratio < 0.9 else '  '
+        print(f"  {flag} {name:<32} {before['median']:>8.3f}s -> {result['median']:>8.3f}s "
+              f"({ratio:.2f}x)", file=sys.stderr)
+
+BENCHMARKS: Dict[str, Callable[[BenchmarkRun], None]] = {
+    'snapshot': BenchmarkRun.bench_snapshot_rollback,
+    'switch': BenchmarkRun.bench_switch,
+    'cache': BenchmarkRun.bench_cache,
+    'download': BenchmarkRun.bench_download
+}
+
+@click.command()
+@click.option('--only', multiple=True, type=click.Choice(list(BENCHMARKS)), help='只运行指定的基准')
+@click.option('--repeat', type=click.IntRange(1), default=3, help='每项基准的重复次数')
+@click.option('--size-scale', type=float, default=0.02, help='文件大小相对真实工具包的比例')
+@click.option('--count-scale', type=float, default=1.0, help='文件数量相对真实工具包的比例')
+@click.option('--installer-mb', type=click.IntRange(1), default=64, help='合成安装包大小（MB）')
+@click.option('--bandwidth', help='本机服务器的总带宽上限（每秒），如 200MB；默认不限制')
+@click.option('--connection-bandwidth', default='100MB', show_default=True,
+              help='本机服务器单个连接的带宽上限（每秒），0表示不限制')
+@click.option('--seed', type=int, default=0)
+@click.option('--root', type=click.Path(file_okay=False), help='工作目录（默认使用临时目录）')
+@click.option('--keep', is_flag=True, help='保留工作目录')
+@click.option('--output', type=click.Path(dir_okay=False), help='结果JSON文件（默认输出到标准输出）')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), help='与之前的结果对比')
+def main(only, repeat, size_scale, count_scale, installer_mb, bandwidth, connection_bandwidth,
+         seed, root, keep, output, compare):
+    """运行性能基准"""
+    sys.path.insert(0, str(REPO_ROOT))
+    from src.config import parse_size
+
+    root = Path(root) if root else Path(tempfile.mkdtemp(prefix='dlmate-bench-'))
+    root.mkdir(parents=True, exist_ok=True)
+    run = BenchmarkRun(root, repeat, size_scale, count_scale, installer_mb * MB,
+                       parse_size(bandwidth), parse_size(connection_bandwidth), seed)
+
+    started = time.perf_counter()
+    try:
+        # 被测代码的进度输出转到标准错误，标准输出只输出结果JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            run.prepare()
+            for name in only or BENCHMARKS:
+                BENCHMARKS[name](run)
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    results = {
+        'meta': {
+            **_git_revision(),
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seconds': round(time.perf_counter() - started, 1),
+            'config': {'repeat': repeat, 'size_scale': size_scale, 'count_scale': count_scale,
+                       'installer_mb': installer_mb, 'bandwidth': bandwidth,
+                       'connection_bandwidth': connection_bandwidth, 'seed': seed},
+            'toolkits': run.toolkits
+        },
+        'results': run.results
+    }
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 结果已写入 {output}", file=sys.stderr)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if compare:
+        _compare(results, Path(compare))
+
+if __name__ == '__main__':
+    main()
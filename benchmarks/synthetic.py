@@ -0,0 +1,103 @@
+import os
+import json
+import random
+import hashlib
+from pathlib import Path
+from typing import Dict
+
+MB = 1024 * 1024
+
+# 按真实cuda-12.x工具包（含nsight）的目录结构估计的文件数量和大小分布：
+# (目录, 文件数, 大小中位数, 对数正态分布的sigma, 内容类型, 后缀)
+# size_scale=1、count_scale=1时约4500个文件、5GB左右
+TOOLKIT_PROFILE = [
+    ('targets/x86_64-linux/include', 1600, 10 * 1024, 1.2, 'text', '.h'),
+    ('targets/x86_64-linux/include/crt', 40, 20 * 1024, 1.0, 'text', '.hpp'),
+    ('targets/x86_64-linux/lib', 45, 20 * MB, 1.3, 'binary', '.so'),
+    ('targets/x86_64-linux/lib', 35, 15 * MB, 1.2, 'binary', '.a'),
+    ('bin', 35, 3 * MB, 1.5, 'binary', ''),
+    ('nvvm/lib64', 4, 30 * MB, 0.5, 'binary', '.so'),
+    ('nvvm/libdevice', 2, 500 * 1024, 0.3, 'binary', '.bc'),
+    ('extras/CUPTI/lib64', 12, 5 * MB, 1.0, 'binary', '.so'),
+    ('extras/CUPTI/include', 60, 20 * 1024, 1.0, 'text', '.h'),
+    ('nsight-compute/sections', 300, 15 * 1024, 1.0, 'text', '.section'),
+    ('nsight-compute/host', 700, 300 * 1024, 1.5, 'binary', '.so'),
+    ('nsight-systems/host-linux-x64', 900, 300 * 1024, 1.5, 'binary', '.so'),
+    ('nsight-systems/target-linux-x64', 300, 300 * 1024, 1.5, 'binary', ''),
+    ('share/doc', 200, 10 * 1024, 1.0, 'text', '.txt'),
+]
+MAX_FILE_SIZE = 800 * MB
+
+def generate_toolkit(root: Path, version: str, size_scale: float = 0.02,
+                     count_scale: float = 1.0, shared_fraction: float = 0.4,
+                     seed: int = 0) -> Dict:
+    """在root下生成形似cuda-<version>的工具包目录，返回文件数、字节数和软链接数
+
+    同一seed生成的结果完全一致；不同版本之间约shared_fraction的文件内容相同，
+    用于模拟版本间可以去重的部分。
+    """
+    target = root / f'cuda-{version}'
+    stats = {'files': 0, 'bytes': 0, 'symlinks': 0}
+    layout = random.Random(seed)
+
+    for directory, count, median, sigma, kind, suffix in TOOLKIT_PROFILE:
+        path = target / directory
+        path.mkdir(parents=True, exist_ok=True)
+        for index in range(max(1, round(count * count_scale))):
+            size = min(MAX_FILE_SIZE, int(layout.lognormvariate(0, sigma) * median * size_scale))
+            name = f'{Path(directory).name}_{index}{suffix}'
+            shared = layout.random() < shared_fraction
+            content_seed = f'{seed}:{directory}:{index}' + ('' if shared else f':{version}')
+
+            if suffix == '.so':
+                # 共享库带有 libX.so -> libX.so.12 -> libX.so.12.x.y 的软链接链
+                full_name = f'lib{name}.{version}.{index}'
+                _write_file(path / full_name, size, kind, content_seed)
+                os.symlink(full_name, path / f'lib{name}.{version.split(".")[0]}')
+                os.symlink(f'lib{name}.{version.split(".")[0]}', path / f'lib{name}')
+                stats['symlinks'] += 2
+            else:
+                _write_file(path / name, size, kind, content_seed)
+            stats['files'] += 1
+            stats['bytes'] += size
+
+    # 与真实工具包一样，include和lib64是指向targets/下的软链接
+    os.symlink('targets/x86_64-linux/include', target / 'include')
+    os.symlink('targets/x86_64-linux/lib', target / 'lib64')
+    stats['symlinks'] += 2
+
+    nvcc = target / 'bin' / 'nvcc'
+    nvcc.write_text(f'#!/bin/sh\necho "Cuda compilation tools, release {version}, '
+                    f'V{version}.0"\n')
+    nvcc.chmod(0o755)
+    with open(target / 'version.json', 'w') as f:
+        json.dump({'cuda': {'name': 'CUDA SDK', 'version': f'{version}.0'}}, f)
+    stats['files'] += 2
+    return stats
+
+def generate_installer(path: Path, size: int, seed: int = 0) -> str:
+    """生成假的.run安装包，返回其SHA-256"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _write_file(path, size, 'binary', f'installer:{seed}')
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(8 * MB), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def _write_file(path: Path, size: int, kind: str, content_seed: str):
+    """写入确定性的内容：二进制约一半可压缩，文本高度可压缩"""
+    rng = random.Random(content_seed)
+    with open(path, 'wb') as f:
+        written = 0
+        while written < size:
+            block = min(MB, size - written)
+            if kind == 'text':
+                words = [f'cuda{rng.randrange(1000)}' for _ in range(16)]
+                line = (' '.join(words) + ';\n').encode()
+                data = (line * (block // len(line) + 1))[:block]
+            else:
+                half = block // 2
+                data = rng.randbytes(half) + bytes(block - half)
+            f.write(data)
+            written += block
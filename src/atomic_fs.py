@@ -0,0 +1,103 @@
+import os
+import errno
+import ctypes
+import shutil
+import subprocess
+from pathlib import Path
+from typing import List, Optional
+
+# linux/fcntl.h / linux/fs.h
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+# 内核或文件系统不支持RENAME_EXCHANGE时的错误
+EXCHANGE_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP}
+
+_renameat2 = None
+
+def _load_renameat2():
+    """从libc获取renameat2（glibc 2.28+），不可用时返回None"""
+    global _renameat2
+    if _renameat2 is None:
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            func = libc.renameat2
+            func.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int,
+                             ctypes.c_char_p, ctypes.c_uint]
+            func.restype = ctypes.c_int
+            _renameat2 = func
+        except (OSError, AttributeError):
+            _renameat2 = False
+    return _renameat2 or None
+
+def exchange(a: Path, b: Path) -> bool:
+    """原子地交换两个路径（renameat2 RENAME_EXCHANGE），不支持时返回False"""
+    func = _load_renameat2()
+    if func is None:
+        return False
+    if func(AT_FDCWD, os.fsencode(a), AT_FDCWD, os.fsencode(b), RENAME_EXCHANGE) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in EXCHANGE_UNSUPPORTED:
+        return False
+    raise OSError(err, os.strerror(err), str(a), None, str(b))
+
+def swap_into_place(staged: Path, target: Path, trash: Path):
+    """把同一文件系统上准备好的staged换到target
+
+    target不存在时直接rename；存在时优先原子交换，交换后的旧内容移入trash。
+    不支持交换的文件系统上退化为两次rename，中间只有极短的窗口。
+    """
+    if not (target.exists() or target.is_symlink()):
+        os.rename(staged, target)
+        return
+
+    trash.mkdir(parents=True, exist_ok=True)
+    if exchange(staged, target):
+        os.rename(staged, trash / target.name)
+    else:
+        os.rename(target, trash / target.name)
+        os.rename(staged, target)
+
+def replace_symlink(link: Path, link_target: str):
+    """通过临时软链接加rename原子地替换软链接，任何时刻link都有效"""
+    tmp_link = link.with_name(f'.{link.name}.dlmate-tmp')
+    if tmp_link.is_symlink() or tmp_link.exists():
+        tmp_link.unlink()
+    os.symlink(link_target, tmp_link)
+    os.replace(tmp_link, link)
+
+def move_to_trash(path: Path, trash: Path):
+    """把路径移入同文件系统的回收目录，真正的删除稍后在后台进行"""
+    if path.is_symlink() or path.is_file():
+        path.unlink()
+    elif path.exists():
+        trash.mkdir(parents=True, exist_ok=True)
+        try:
+            os.rename(path, trash / path.name)
+        except OSError as e:
+            # 路径本身是挂载点等无法rename的情况，只能就地删除
+            if e.errno not in (errno.EXDEV, errno.EBUSY):
+                raise
+            shutil.rmtree(path)
+
+def delete_in_background(paths: List[Path]) -> Optional[int]:
+    """以最低CPU/IO优先级在独立进程中删除目录，返回删除进程的pid"""
+    paths = [str(path) for path in paths if path.exists()]
+    if not paths:
+        return None
+
+    cmd = ['nice', '-n', '19']
+    if shutil.which('ionice'):
+        cmd += ['ionice', '-c', '3']
+    cmd += ['rm', '-rf', '--'] + paths
+
+    try:
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL, start_new_session=True)
+        return process.pid
+    except OSError:
+        # 没有nice/rm等外部命令时在当前进程内删除
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+        return None
@@ -0,0 +1,110 @@
+from typing import Dict, Iterable, List, Optional
+from .config import load_config, parse_size
+from .chunk_store import ChunkStore
+from .installer_cache import InstallerCache
+
+class CacheManager:
+    """按配置的auto_cleanup策略管理工具包缓存和安装包缓存，超限时按LRU淘汰"""
+
+    def __init__(self, store: Optional[ChunkStore] = None,
+                 installers: Optional[InstallerCache] = None,
+                 active_version: Optional[str] = None):
+        self.store = store or ChunkStore()
+        self.installers = installers or InstallerCache()
+        self.active_version = active_version  # 当前激活的版本永不淘汰
+        self.keep_versions = None
+        self.size_limit = None
+
+    def entries(self) -> List[Dict]:
+        """所有缓存条目：类型、版本、标识以及最近使用时间"""
+        entries = []
+        for version in self.store.versions():
+            entries.append({'kind': 'toolkit', 'version': version, 'key': version,
+                            'last_used': self.store.last_used(version) or ''})
+
+        installers = {}
+        for entry in self.installers.entries().values():
+            # 同一安装包可能对应多个索引条目，按内容合并
+            item = installers.setdefault(entry['sha256'], {
+                'kind': 'installer', 'version': entry['version'], 'key': entry['sha256'],
+                'last_used': ''})
+            item['last_used'] = max(item['last_used'],
+                                    entry.get('last_used') or entry.get('added', ''))
+        entries.extend(installers.values())
+        return entries
+
+    def disk_usage(self) -> int:
+        return self.store.disk_usage() + self.installers.disk_usage()
+
+    def usage(self, rescan: bool = False) -> Dict:
+        """缓存占用汇总，来自各缓存的大小索引；rescan=True时先从磁盘重建索引"""
+        index = self.store.rescan() if rescan else self.store.size_index()
+        installers = {entry['sha256'] for entry in self.installers.entries().values()}
+        toolkit_bytes = index['chunk_bytes'] + index['legacy_bytes']
+        installer_bytes = self.installers.disk_usage()
+        return {
+            'toolkits': len(index['versions']),
+            'toolkit_bytes': toolkit_bytes,
+            'toolkit_logical_bytes': sum(item['bytes'] for item in index['versions'].values()),
+            'installers': len(installers),
+            'installer_bytes': installer_bytes,
+            'total_bytes': toolkit_bytes + installer_bytes
+        }
+
+    def enforce(self, incoming: int = 0, protect: Iterable[str] = ()) -> List[Dict]:
+        """按保留版本数和总大小限制淘汰缓存，为即将写入的incoming字节腾出空间
+
+        protect中的版本以及当前激活的版本不会被淘汰。返回被淘汰的条目。
+        """
+        settings = load_config().get('auto_cleanup') or {}
+        self.keep_versions = settings.get('keep_versions')
+        self.size_limit = parse_size(settings.get('cache_size_limit'))
+
+        protected = set(protect)
+        if self.active_version:
+            protected.add(self.active_version)
+
+        evicted = []
+        entries = sorted(self.entries(), key=lambda entry: entry['last_used'], reverse=True)
+
+        # 1. 每类缓存最多保留keep_versions个版本，超出的部分从最久未使用的开始淘汰
+        if self.keep_versions:
+            for kind in ('toolkit', 'installer'):
+                kept = set()
+                for entry in entries:
+                    if entry['kind'] != kind:
+                        continue
+                    if entry['version'] in protected or entry['version'] in kept or \
+                            len(kept) < self.keep_versions:
+                        kept.add(entry['version'])
+                    else:
+                        evicted.append(self._evict(entry))
+
+        # 2. 总大小超限时继续淘汰最久未使用的条目
+        if self.size_limit:
+            remaining = [entry for entry in entries if entry not in evicted]
+            usage = self.disk_usage()
+            while usage + incoming > self.size_limit:
+                candidates = [entry for entry in remaining if entry['version'] not in protected]
+                if not candidates:
+                    print(f"⚠️ 缓存超出限制 {self.size_limit / (1024 ** 3):.1f} GB，"
+                          f"但剩余条目均在使用中")
+                    break
+                entry = candidates[-1]
+                remaining.remove(entry)
+                evicted.append(self._evict(entry))
+                usage = self.disk_usage()
+
+        return evicted
+
+    def _evict(self, entry: Dict) -> Dict:
+        """删除一个缓存条目"""
+        if entry['kind'] == 'toolkit':
+            freed = self.store.remove(entry['key'])
+        else:
+            freed = self.installers.remove(entry['key'])
+        entry['freed'] = freed
+        print(f"🧹 淘汰缓存: CUDA {entry['version']} "
+              f"{'工具包' if entry['kind'] == 'toolkit' else '安装包'}"
+              f"（释放 {freed / (1024 ** 2):.1f} MB）")
+        return entry
@@ -0,0 +1,418 @@
+import os
+import json
+import time
+import zlib
+import fcntl
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 每个数据块文件的首字节标明编码方式
+CODEC_RAW = b'r'
+CODEC_ZLIB = b'z'
+CODEC_ZSTD = b's'
+
+class ChunkStore:
+    """压缩、分块去重的CUDA工具包缓存
+
+    每个文件按固定大小切块，以未压缩内容的SHA-256寻址，不同版本间相同的块只存一份。
+    每个版本对应一份清单，记录目录结构、元数据以及各文件的块列表。
+    """
+
+    def __init__(self, root: Optional[Path] = None, chunk_size: int = 4 * 1024 * 1024,
+                 workers: Optional[int] = None):
+        self.root = root or Path.home() / '.deeplearningmate' / 'cuda_cache'
+        self.chunk_dir = self.root / 'chunks'
+        self.manifest_dir = self.root / 'manifests'
+        self.usage_file = self.root / 'usage.json'
+        self.index_file = self.root / 'size_index.json'
+        self.chunk_size = chunk_size
+        # 压缩和哈希都会释放GIL，线程池可以利用多核
+        self.workers = workers or min(16, os.cpu_count() or 4)
+        self.level = 3 if zstandard else 6
+
+    def has(self, version: str) -> bool:
+        return self._manifest_path(version).exists()
+
+    def versions(self) -> List[str]:
+        """列出缓存中的版本"""
+        return sorted(path.name[len('cuda-'):-len('.json')]
+                      for path in self.manifest_dir.glob('cuda-*.json'))
+
+    def store(self, version: str, source: Path) -> Dict:
+        """把source目录存入缓存，返回文件数、原始字节数、新增块数和新增的压缩字节数"""
+        # 与gc互斥：块写入后、清单保存前，这些块尚未被任何清单引用
+        with self._lock(fcntl.LOCK_SH):
+            started = time.monotonic()
+            self.chunk_dir.mkdir(parents=True, exist_ok=True)
+            self.manifest_dir.mkdir(parents=True, exist_ok=True)
+            self.size_index()  # 写入前确保索引存在，之后只做增量更新
+            entries = {}
+            files = []
+            self._scan(str(source), '', entries, files)
+
+            stats = {'files': len(files), 'bytes': sum(entries[rel][1] for rel in files),
+                     'new_chunks': 0, 'stored_bytes': 0}
+            lock = threading.Lock()
+            from tqdm import tqdm  # 进度条只在读写缓存时需要，读取大小索引时不导入
+
+            with tqdm(desc=f'cuda-{version}', total=stats['bytes'], unit='B', unit_scale=True,
+                      unit_divisor=1024) as pbar:
+                def store_file(rel: str):
+                    chunks = []
+                    with open(os.path.join(source, rel), 'rb') as f:
+                        for data in iter(lambda: f.read(self.chunk_size), b''):
+                            digest = hashlib.sha256(data).hexdigest()
+                            written = self._put_chunk(digest, data)
+                            chunks.append(digest)
+                            with lock:
+                                if written:
+                                    stats['new_chunks'] += 1
+                                    stats['stored_bytes'] += written
+                                pbar.update(len(data))
+                    entries[rel][5] = chunks
+
+                try:
+                    with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                        list(pool.map(store_file, files))
+                except BaseException:
+                    # 已写入的块仍计入大小索引，下次gc回收时再扣除
+                    self._update_index(lambda index: self._count_chunks(index, stats))
+                    raise
+
+            self._save_manifest(version, {
+                'version': version,
+                'source': str(source),
+                'created': datetime.now().isoformat(),
+                'chunk_size': self.chunk_size,
+                'bytes': stats['bytes'],
+                'entries': entries
+            })
+
+            def record(index: Dict):
+                self._count_chunks(index, stats)
+                index['versions'][version] = {'files': stats['files'], 'bytes': stats['bytes']}
+            self._update_index(record)
+
+            self.touch(version)
+            stats['seconds'] = round(time.monotonic() - started, 3)
+            return stats
+
+    def restore(self, version: str, target: Path) -> Dict:
+        """把缓存的版本并行解压到target（target不能已存在）"""
+        with self._lock(fcntl.LOCK_SH):
+            started = time.monotonic()
+            manifest = self.load_manifest(version)
+            entries = manifest['entries']
+
+            os.mkdir(target)
+            directories = [(str(target), entries['.'])]
+            files = []
+            for rel in sorted(entries):
+                if rel == '.':
+                    continue
+                entry = entries[rel]
+                path = os.path.join(target, rel)
+                if entry[0] == 'd':
+                    os.mkdir(path)
+                    directories.append((path, entry))
+                elif entry[0] == 'l':
+                    os.symlink(entry[4], path)
+                else:
+                    files.append((path, entry))
+
+            lock = threading.Lock()
+            from tqdm import tqdm
+            with tqdm(desc=f'cuda-{version}', total=manifest['bytes'], unit='B', unit_scale=True,
+                      unit_divisor=1024) as pbar:
+                def restore_file(item):
+                    path, entry = item
+                    with open(path, 'xb') as f:
+                        for digest in entry[5]:
+                            data = self._get_chunk(digest)
+                            f.write(data)
+                            with lock:
+                                pbar.update(len(data))
+                    os.chmod(path, entry[2] & 0o7777)
+                    os.utime(path, ns=(entry[3], entry[3]))
+
+                with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    list(pool.map(restore_file, files))
+
+            # 最后设置目录的权限和时间
+            for path, entry in reversed(directories):
+                os.chmod(path, entry[2] & 0o7777)
+                os.utime(path, ns=(entry[3], entry[3]))
+
+            self.touch(version)
+            return {'files': len(files), 'bytes': manifest['bytes'],
+                    'seconds': round(time.monotonic() - started, 3)}
+
+    def remove(self, version: str) -> int:
+        """删除版本清单并回收不再被引用的块，返回释放的字节数"""
+        with self._lock(fcntl.LOCK_EX):
+            self._manifest_path(version).unlink(missing_ok=True)
+            usage = self._load_usage()
+            if usage.pop(version, None) is not None:
+                self._save_usage(usage)
+            return self._gc()
+
+    def remove_legacy(self, version: str) -> int:
+        """删除旧版的完整复制缓存目录，返回释放的字节数"""
+        path = self.root / f'cuda-{version}'
+        if not path.is_dir():
+            return 0
+        freed = self._tree_size(str(path))
+        shutil.rmtree(path)
+
+        def record(index: Dict):
+            index['legacy_bytes'] = max(0, index['legacy_bytes'] - freed)
+        self._update_index(record)
+        return freed
+
+    def touch(self, version: str):
+        """记录版本最近一次被使用的时间"""
+        usage = self._load_usage()
+        usage[version] = datetime.now().isoformat()
+        self._save_usage(usage)
+
+    def last_used(self, version: str) -> Optional[str]:
+        return self._load_usage().get(version)
+
+    def gc(self) -> int:
+        """删除没有任何清单引用的块，返回释放的字节数"""
+        with self._lock(fcntl.LOCK_EX):
+            return self._gc()
+
+    def _gc(self) -> int:
+        referenced = set()
+        for version in self.versions():
+            for entry in self.load_manifest(version)['entries'].values():
+                if entry[0] == 'f':
+                    referenced.update(entry[5])
+
+        freed = removed = 0
+        for chunk in self.chunk_dir.glob('*/*'):
+            if chunk.name not in referenced and not chunk.name.endswith('.tmp'):
+                freed += chunk.stat().st_size
+                removed += 1
+                chunk.unlink()
+
+        def record(index: Dict):
+            index['chunk_bytes'] = max(0, index['chunk_bytes'] - freed)
+            index['chunks'] = max(0, index['chunks'] - removed)
+            for version in set(index['versions']) - set(self.versions()):
+                del index['versions'][version]
+        self._update_index(record)
+        return freed
+
+    def disk_usage(self) -> int:
+        """缓存实际占用的字节数，从大小索引读取而不遍历磁盘"""
+        index = self.size_index()
+        return index['chunk_bytes'] + index['legacy_bytes']
+
+    def size_index(self) -> Dict:
+        """读取增量维护的大小索引；索引不存在或损坏时重新扫描"""
+        try:
+            with open(self.index_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return self.rescan()
+
+    def rescan(self) -> Dict:
+        """并行扫描磁盘重建大小索引"""
+        if not self.root.is_dir():
+            return {'chunk_bytes': 0, 'chunks': 0, 'legacy_bytes': 0, 'versions': {}}
+
+        prefixes = []
+        if self.chunk_dir.is_dir():
+            prefixes = [entry.path for entry in os.scandir(self.chunk_dir) if entry.is_dir()]
+        legacy = [entry.path for entry in os.scandir(self.root)
+                  if entry.name.startswith('cuda-') and entry.is_dir(follow_symlinks=False)]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            chunk_results = list(pool.map(self._scan_chunks, prefixes))
+            legacy_sizes = list(pool.map(self._tree_size, legacy))
+
+        index = {
+            'chunk_bytes': sum(size for size, _ in chunk_results),
+            'chunks': sum(count for _, count in chunk_results),
+            'legacy_bytes': sum(legacy_sizes),
+            'versions': {},
+            'scanned': datetime.now().isoformat()
+        }
+        for version in self.versions():
+            manifest = self.load_manifest(version)
+            index['versions'][version] = {
+                'files': sum(1 for entry in manifest['entries'].values() if entry[0] == 'f'),
+                'bytes': manifest['bytes']
+            }
+        self._save_index(index)
+        return index
+
+    @staticmethod
+    def _scan_chunks(prefix_dir: str):
+        size = count = 0
+        with os.scandir(prefix_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.tmp'):
+                    size += entry.stat(follow_symlinks=False).st_size
+                    count += 1
+        return size, count
+
+    @staticmethod
+    def _tree_size(path: str) -> int:
+        """旧版缓存目录（完整复制）的大小"""
+        total = 0
+        for dirpath, _, filenames in os.walk(path):
+            for name in filenames:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+        return total
+
+    @contextmanager
+    def _lock(self, operation: int):
+        """跨进程的缓存锁：写入和读取取共享锁，回收块取排他锁
+
+        后台预取进程淘汰缓存时，前台正在写入的版本还没有清单，其块不能被当作无引用回收。
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / '.lock', 'w') as lock:
+            fcntl.flock(lock, operation)
+            yield
+
+    @contextmanager
+    def _index_lock(self):
+        """大小索引读-改-写的短时排他锁；并发写入的版本共享缓存锁，索引更新仍须串行"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / '.index.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _update_index(self, update: Callable[[Dict], None]):
+        with self._index_lock():
+            index = self.size_index()
+            update(index)
+            self._save_index(index)
+
+    @staticmethod
+    def _count_chunks(index: Dict, stats: Dict):
+        index['chunk_bytes'] += stats['stored_bytes']
+        index['chunks'] += stats['new_chunks']
+
+    def _save_index(self, index: Dict):
+        tmp_file = self.index_file.with_name(self.index_file.name + '.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_file, self.index_file)
+
+    def load_manifest(self, version: str) -> Dict:
+        with open(self._manifest_path(version)) as f:
+            return json.load(f)
+
+    def _save_manifest(self, version: str, manifest: Dict):
+        path = self._manifest_path(version)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def _load_usage(self) -> Dict[str, str]:
+        if not self.usage_file.exists():
+            return {}
+        try:
+            with open(self.usage_file) as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def _save_usage(self, usage: Dict[str, str]):
+        tmp_file = self.usage_file.with_name(self.usage_file.name + '.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(usage, f, indent=2)
+        os.replace(tmp_file, self.usage_file)
+
+    def _manifest_path(self, version: str) -> Path:
+        return self.manifest_dir / f'cuda-{version}.json'
+
+    def _scan(self, root: str, rel: str, entries: Dict, files: List[str]):
+        """记录目录结构和元数据；条目为 [类型, 大小, 权限, 修改时间, 软链接指向, 块列表]"""
+        path = os.path.join(root, rel) if rel else root
+        stat = os.lstat(path)
+        entries[rel or '.'] = ['d', 0, stat.st_mode, stat.st_mtime_ns, None, None]
+
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                child = os.path.join(rel, entry.name) if rel else entry.name
+                if entry.is_symlink():
+                    stat = entry.stat(follow_symlinks=False)
+                    entries[child] = ['l', 0, stat.st_mode, stat.st_mtime_ns,
+                                      os.readlink(entry.path), None]
+                elif entry.is_dir(follow_symlinks=False):
+                    self._scan(root, child, entries, files)
+                else:
+                    stat = entry.stat(follow_symlinks=False)
+                    entries[child] = ['f', stat.st_size, stat.st_mode, stat.st_mtime_ns, None, []]
+                    files.append(child)
+
+    def _chunk_path(self, digest: str) -> Path:
+        return self.chunk_dir / digest[:2] / digest
+
+    def _put_chunk(self, digest: str, data: bytes) -> int:
+        """压缩并写入一个块；块已存在时返回0，否则返回写入的字节数"""
+        path = self._chunk_path(digest)
+        if path.exists():
+            return 0
+
+        payload = self._compress(data)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(f'{digest}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        # link在目标已存在时失败，并发写入同一个块时只有一方计入大小索引
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            return 0
+        finally:
+            os.unlink(tmp_path)
+        return len(payload)
+
+    def _get_chunk(self, digest: str) -> bytes:
+        """读取并解压一个块，同时校验内容"""
+        with open(self._chunk_path(digest), 'rb') as f:
+            payload = f.read()
+
+        codec, body = payload[:1], payload[1:]
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("该缓存块使用zstd压缩，请安装zstandard")
+            data = zstandard.ZstdDecompressor().decompress(body)
+        elif codec == CODEC_ZLIB:
+            data = zlib.decompress(body)
+        else:
+            data = body
+
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise IOError(f"缓存块已损坏: {digest}")
+        return data
+
+    def _compress(self, data: bytes) -> bytes:
+        """压缩数据；压缩无收益的块（已压缩的数据等）按原样保存"""
+        if zstandard is not None:
+            codec, body = CODEC_ZSTD, zstandard.ZstdCompressor(level=self.level).compress(data)
+        else:
+            codec, body = CODEC_ZLIB, zlib.compress(data, self.level)
+
+        if len(body) >= len(data):
+            return CODEC_RAW + data
+        return codec + body
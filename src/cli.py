@@ -1,29 +1,46 @@
 import click
 import sys
 from pathlib import Path
-from .version_manager import CudaVersionManager
 from .version_detector import CudaVersionDetector
-from .transaction_manager import TransactionManager
+
+# 其余模块（requests、tqdm、事务管理等）只在用到它们的命令中导入，
+# 使status、list-versions等只读命令启动迅速且不产生任何副作用
 
 @click.group()
 @click.version_option(version='1.0.0')
-def cli():
+@click.option('--trace', type=click.Path(dir_okay=False),
+              help='把各阶段耗时写入FILE（Chrome trace JSON；以.jsonl结尾时写JSON lines）')
+def cli(trace):
     """🚀 DeepLearningMate - 深度学习环境管理工具"""
-    pass
+    if trace:
+        from .tracing import enable_tracing
+        enable_tracing(Path(trace))
 
 @cli.command()
-def status():
+@click.option('--rescan', is_flag=True, help='重新扫描磁盘重建缓存大小索引')
+def status(rescan):
     """显示当前环境状态"""
+    from .toolkit_inventory import ToolkitInventory
+    from .cache_manager import CacheManager
+    
     detector = CudaVersionDetector()
     current = detector.get_current_cuda_version()
-    installed = detector.get_installed_cuda_versions()
+    toolkits = ToolkitInventory().toolkits(refresh=rescan)
     
     click.echo("📊 当前环境状态")
     click.echo("=" * 30)
     click.echo(f"当前CUDA版本: {click.style(current or '未安装', fg='green' if current else 'red')}")
     
-    if installed:
-        click.echo(f"已安装版本: {', '.join(installed)}")
+    if toolkits:
+        click.echo("已安装工具包:")
+        for toolkit in toolkits:
+            details = [toolkit['source']]
+            if toolkit['cudnn']:
+                details.append(f"cuDNN {toolkit['cudnn']}")
+            details.append('nvcc' if toolkit['nvcc'] else '无nvcc')
+            details.append(f"{toolkit['size'] / (1024 ** 3):.1f} GB")
+            click.echo(f"  {toolkit['version'] or '未知版本'} - {toolkit['path']} "
+                       f"({', '.join(details)})")
     else:
         click.echo("已安装版本: 无")
     
@@ -37,27 +54,33 @@ def status():
             click.echo("GPU驱动: ❌ 异常")
     except FileNotFoundError:
         click.echo("GPU驱动: ❌ 未安装")
+    
+    usage = CacheManager(active_version=current).usage(rescan=rescan)
+    click.echo(f"缓存占用: {usage['total_bytes'] / (1024 ** 3):.2f} GB "
+               f"(工具包 {usage['toolkits']} 个, 安装包 {usage['installers']} 个)")
 
 @cli.command()
 @click.argument('version')
 @click.option('--framework', type=click.Choice(['pytorch', 'tensorflow', 'both']), 
               help='同时安装深度学习框架')
-@click.option('--mirror', type=click.Choice(['official', 'china']), default='official',
-              help='下载镜像源')
-def install(version, framework, mirror):
+@click.option('--mirror', type=click.Choice(['auto', 'official', 'china']), default='auto',
+              help='下载镜像源（auto: 测速选择最快镜像并自动切换）')
+@click.option('--connections', type=click.IntRange(1, 32), default=4,
+              help='分段下载的并发连接数')
+def install(version, framework, mirror, connections):
     """安装指定版本的CUDA环境"""
     click.echo(f"🚀 开始安装CUDA {version}")
     
     if framework:
         click.echo(f"📦 将同时安装: {framework}")
     
-    manager = CudaVersionManager()
-    
-    # 设置镜像源 - 需要实现具体逻辑
     if mirror == 'china':
         click.echo("🇨🇳 使用国内镜像源")
-        # 设置下载器使用国内镜像源
-        _configure_china_mirror()
+    elif mirror == 'auto':
+        click.echo("🌐 自动选择最快的镜像源")
+    
+    from .version_manager import CudaVersionManager
+    manager = CudaVersionManager(connections=connections, mirror=mirror)
     
     try:
         if manager.install_cuda_version(version):
@@ -79,11 +102,6 @@ def install(version, framework, mirror):
     except Exception as e:
         click.echo(f"❌ 安装过程中发生错误: {e}")
 
-def _configure_china_mirror():
-    """配置国内镜像源"""
-    # 可以在这里修改下载器的URL配置
-    pass
-
 def _install_frameworks(framework, cuda_version, mirror):
     """安装深度学习框架的辅助函数"""
     from .framework_installer import FrameworkInstaller
@@ -167,7 +185,7 @@ def interactive():
         selected_framework = framework_mapping.get(framework)
         
         ctx.invoke(install, version=recommended_version, 
-                  framework=selected_framework, mirror='official')
+                  framework=selected_framework, mirror='auto')
 
 def _get_recommended_version(use_case, framework):
     """根据使用场景推荐CUDA版本"""
@@ -199,6 +217,7 @@ def uninstall(force, keep_config, keep_cuda):
         
         # 2. 清理缓存和临时文件
         click.echo("🧹 清理缓存...")
+        from .version_manager import CudaVersionManager
         manager = CudaVersionManager()
         cache_dir = Path.home() / '.deeplearningmate'
         
@@ -227,24 +246,25 @@ def uninstall(force, keep_config, keep_cuda):
         click.echo("💡 请尝试运行: ./uninstall.sh")
 
 @cli.command()
-def cleanup():
+@click.option('--rescan', is_flag=True, help='重新扫描磁盘重建缓存大小索引')
+def cleanup(rescan):
     """清理缓存和临时文件"""
     click.echo("🧹 清理缓存和临时文件...")
     
     cache_dir = Path.home() / '.deeplearningmate' / 'cuda_cache'
     temp_dir = Path.home() / '.deeplearningmate' / 'temp'
     
-    total_size = 0
+    from .cache_manager import CacheManager
     
-    # 计算缓存大小
-    if cache_dir.exists():
-        for file_path in cache_dir.rglob('*'):
-            if file_path.is_file():
-                total_size += file_path.stat().st_size
+    # 缓存大小来自增量维护的索引，无需遍历缓存目录
+    usage = CacheManager().usage(rescan=rescan)
+    total_size = usage['toolkit_bytes']
     
     if total_size > 0:
         size_mb = total_size / (1024 * 1024)
-        click.echo(f"📊 缓存大小: {size_mb:.1f} MB")
+        click.echo(f"📊 缓存大小: {size_mb:.1f} MB "
+                   f"({usage['toolkits']} 个版本，解压后 "
+                   f"{usage['toolkit_logical_bytes'] / (1024 * 1024):.1f} MB)")
         
         if click.confirm('确定要清理缓存吗？'):
             import shutil
@@ -307,28 +327,43 @@ def _cleanup_environment():
 @cli.command('list-versions')
 def list_versions():
     """列出所有可用的CUDA版本"""
-    manager = CudaVersionManager()
-    available = manager.list_available_versions()
-    installed = manager.list_installed_versions()
+    from .download_catalog import DOWNLOAD_URLS
+    from .toolkit_inventory import ToolkitInventory
+    
+    available = list(DOWNLOAD_URLS.keys())
+    
+    # 已安装版本来自工具包清单；conda/pip提供的运行时不能通过switch切换，单独标注
+    installed = set()
+    others = {}
+    for toolkit in ToolkitInventory().toolkits():
+        if not toolkit['version']:
+            continue
+        version = '.'.join(toolkit['version'].split('.')[:2])
+        if toolkit['source'] == 'system':
+            installed.add(version)
+        else:
+            others.setdefault(version, set()).add(toolkit['source'])
     
     click.echo("📋 CUDA版本列表")
     click.echo("=" * 30)
     
     for version in available:
         status = "✅ 已安装" if version in installed else "⬜ 未安装"
+        if version in others:
+            status += f" ({'/'.join(sorted(others[version]))}中可用)"
         click.echo(f"  {version} - {status}")
 
 @cli.command()
 @click.argument('version')
 def switch(version):
     """切换到指定的CUDA版本"""
+    from .version_manager import CudaVersionManager
     manager = CudaVersionManager()
     
-    with manager.transaction_manager.transaction() as tx:
-        if manager._do_switch_cuda_version(version, tx):
-            click.echo(f"✅ 成功切换到CUDA {version}")
-        else:
-            click.echo(f"❌ 切换到CUDA {version}失败")
+    if manager.switch_cuda_version(version):
+        click.echo(f"✅ 成功切换到CUDA {version}")
+    else:
+        click.echo(f"❌ 切换到CUDA {version}失败")
 
 @cli.command()
 def recover():
@@ -338,10 +373,62 @@ def recover():
     monitor._auto_recover()
     click.echo("🔄 自动恢复完成")
 
+@cli.command()
+@click.option('--limit', type=click.IntRange(1), default=20, help='显示的事务数量')
+@click.option('--status', 'status_filter',
+              type=click.Choice(['active', 'committed', 'rolling_back', 'rolled_back',
+                                 'rollback_failed', 'aborted']),
+              help='只显示指定状态的事务')
+def history(limit, status_filter):
+    """显示事务历史"""
+    from .transaction_store import TransactionStore
+
+    # 只读命令：直接查询索引，不初始化事务管理器
+    db_path = Path.home() / '.deeplearningmate' / 'transactions' / 'transactions.db'
+    if not db_path.exists():
+        click.echo("📭 无事务记录")
+        return
+
+    store = TransactionStore(db_path)
+    rows = store.history(limit=limit, status=status_filter)
+    store.close()
+    if not rows:
+        click.echo("📭 无事务记录")
+        return
+
+    click.echo(f"{'事务ID':<40} {'状态':<16} {'开始时间':<20} {'结束时间':<20} {'快照':>10}")
+    for row in rows:
+        start = row['start_time'][:19].replace('T', ' ')
+        end = (row['end_time'] or '')[:19].replace('T', ' ')
+        size = f"{row['stored_bytes'] / (1024 * 1024):.1f} MB" if row['snapshot_dir'] else '已清理'
+        click.echo(f"{row['id']:<40} {row['status']:<16} {start:<20} {end:<20} {size:>10}")
+
+@cli.command('prune-snapshots')
+@click.option('--dry-run', is_flag=True, help='只列出将被删除的快照')
+@click.option('--include-failed', is_flag=True, help='同时删除回滚失败和中止的事务快照')
+def prune_snapshots(dry_run, include_failed):
+    """按保留策略删除旧的事务快照"""
+    from .snapshot_retention import SnapshotRetention
+
+    if not (Path.home() / '.deeplearningmate' / 'transactions' / 'transactions.db').exists():
+        click.echo("📭 无事务记录")
+        return
+
+    pruned = SnapshotRetention().prune(dry_run=dry_run, include_failed=include_failed)
+    if not pruned:
+        click.echo("✅ 没有需要删除的快照")
+    elif dry_run:
+        for row in pruned:
+            click.echo(f"  {row['id']}（{row['status']}，{row['stored_bytes'] / (1024 ** 2):.1f} MB）")
+        click.echo(f"📋 将删除 {len(pruned)} 个快照")
+    else:
+        click.echo(f"✅ 已删除 {len(pruned)} 个快照，数据在后台释放")
+
 @cli.command('install-framework')
 @click.argument('framework', type=click.Choice(['pytorch', 'tensorflow']))
 @click.option('--cuda-version', help='指定CUDA版本')
-@click.option('--mirror', type=click.Choice(['official', 'china']), default='official')
+@click.option('--mirror', type=click.Choice(['auto', 'official', 'china']), default='official',
+              help='PyPI索引（auto: 按下载CUDA时测得的镜像速度选择）')
 def install_framework(framework, cuda_version, mirror):
     """安装深度学习框架"""
     from .framework_installer import FrameworkInstaller
@@ -365,13 +452,48 @@ def install_framework(framework, cuda_version, mirror):
     else:
         click.echo(f"❌ {framework} 安装失败")
 
+@cli.group()
+def wheels():
+    """管理本地wheel仓库"""
+    pass
+
+@wheels.command('sync')
+@click.option('--framework', type=click.Choice(['pytorch', 'tensorflow', 'both']), default='both')
+@click.option('--cuda-version', 'cuda_versions', multiple=True,
+              help='指定CUDA版本（可重复），默认为当前CUDA版本')
+@click.option('--mirror', type=click.Choice(['auto', 'official', 'china']), default='official',
+              help='PyPI索引（auto: 按下载CUDA时测得的镜像速度选择）')
+def wheels_sync(framework, cuda_versions, mirror):
+    """预先下载框架wheel，之后的安装可离线完成"""
+    from .framework_installer import FrameworkInstaller
+
+    if not cuda_versions:
+        current = CudaVersionDetector().get_current_cuda_version()
+        if not current:
+            click.echo("❌ 未检测到CUDA版本，请通过 --cuda-version 指定")
+            return
+        cuda_versions = [current]
+
+    installer = FrameworkInstaller()
+    frameworks = ['pytorch', 'tensorflow'] if framework == 'both' else [framework]
+    for cuda_version in cuda_versions:
+        for name in frameworks:
+            if installer.sync_wheels(name, cuda_version, mirror):
+                click.echo(f"✅ {name} (CUDA {cuda_version}) 已同步到 "
+                           f"{installer.wheel_path(name, cuda_version, mirror)}")
+            else:
+                click.echo(f"❌ {name} (CUDA {cuda_version}) 同步失败")
+
 @cli.command('install-stack')
 @click.argument('framework', type=click.Choice(['pytorch', 'tensorflow']))
 @click.argument('cuda_version')
-@click.option('--mirror', type=click.Choice(['official', 'china']), default='official')
-def install_stack(framework, cuda_version, mirror):
+@click.option('--mirror', type=click.Choice(['auto', 'official', 'china']), default='auto')
+@click.option('--connections', type=click.IntRange(1, 32), default=4,
+              help='分段下载的并发连接数')
+def install_stack(framework, cuda_version, mirror, connections):
     """安装完整深度学习环境（CUDA + cuDNN + 框架）"""
-    manager = CudaVersionManager()
+    from .version_manager import CudaVersionManager
+    manager = CudaVersionManager(connections=connections, mirror=mirror)
     
     # 1. 安装CUDA
     click.echo(f"🚀 安装CUDA {cuda_version}...")
@@ -384,6 +506,40 @@ def install_stack(framework, cuda_version, mirror):
     ctx = click.get_current_context()
     ctx.invoke(install_framework, framework=framework, cuda_version=cuda_version, mirror=mirror)
 
+def _parse_rate(ctx, param, value):
+    """把 10MB 之类的带宽参数解析为字节数，0表示显式不限速"""
+    if value is None:
+        return None
+    from .config import parse_size
+    try:
+        return parse_size(value) or 0
+    except ValueError:
+        raise click.BadParameter(f"无法解析的带宽: {value}（示例: 10MB、512KB、0）")
+
+@cli.command()
+@click.argument('versions', nargs=-1)
+@click.option('--background', is_flag=True, help='在后台以低优先级运行')
+@click.option('--limit-rate', callback=_parse_rate, help='带宽上限（每秒），如 10MB；0表示不限制')
+@click.option('--mirror', type=click.Choice(['auto', 'official', 'china']), default='auto')
+@click.option('--connections', type=click.IntRange(1, 32), help='分段下载的并发连接数')
+def prefetch(versions, background, limit_rate, mirror, connections):
+    """预先下载CUDA安装包到本地缓存"""
+    from .prefetch import Prefetcher
+    
+    prefetcher = Prefetcher(mirror=mirror, connections=connections, rate_limit=limit_rate)
+    
+    if background:
+        pid = prefetcher.start_background(list(versions))
+        if pid is None:
+            click.echo(f"⚠️ 预取任务已在运行 (PID: {prefetcher.running_pid()})")
+        else:
+            click.echo(f"🚀 后台预取已启动 (PID: {pid})，日志: {prefetcher.log_file}")
+        return
+    
+    results = prefetcher.run(list(versions) or None)
+    for version, success in results.items():
+        click.echo(f"  {version} - {'✅ 已缓存' if success else '❌ 失败'}")
+
 @cli.command()
 @click.argument('name')
 def checkpoint(name):
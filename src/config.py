@@ -0,0 +1,32 @@
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+CONFIG_FILE = Path(__file__).resolve().parent.parent / 'configs' / 'cuda_versions.yaml'
+
+_config = None
+
+def load_config() -> Dict:
+    """读取configs/cuda_versions.yaml（进程内只读取一次）"""
+    global _config
+    if _config is None:
+        import yaml  # 只在需要配置时导入，不拖慢CLI启动
+        try:
+            with open(CONFIG_FILE) as f:
+                _config = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            print(f"⚠️ 读取配置文件失败: {e}")
+            _config = {}
+    return _config
+
+def parse_size(value) -> Optional[int]:
+    """解析 "20GB"、"10M"、"512KB" 之类的大小，返回字节数；0表示不限制时返回None"""
+    if value is None:
+        return None
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"无法解析的大小: {value}")
+
+    number, unit = match.groups()
+    size = int(float(number) * 1024 ** ' KMGT'.index(unit.upper() or ' '))
+    return size or None
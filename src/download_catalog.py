@@ -0,0 +1,33 @@
+# CUDA安装包下载地址；不依赖网络相关模块，只读命令可以直接读取
+
+# 官方下载链接
+DOWNLOAD_URLS = {
+    '11.8': {
+        'ubuntu20': 'https://developer.download.nvidia.com/compute/cuda/11.8.0/local_installers/cuda_11.8.0_520.61.05_linux.run',
+        'ubuntu22': 'https://developer.download.nvidia.com/compute/cuda/11.8.0/local_installers/cuda_11.8.0_520.61.05_linux.run'
+    },
+    '12.0': {
+        'ubuntu20': 'https://developer.download.nvidia.com/compute/cuda/12.0.0/local_installers/cuda_12.0.0_525.60.13_linux.run',
+        'ubuntu22': 'https://developer.download.nvidia.com/compute/cuda/12.0.0/local_installers/cuda_12.0.0_525.60.13_linux.run'
+    },
+    '12.1': {
+        'ubuntu20': 'https://developer.download.nvidia.com/compute/cuda/12.1.0/local_installers/cuda_12.1.0_530.30.02_linux.run',
+        'ubuntu22': 'https://developer.download.nvidia.com/compute/cuda/12.1.0/local_installers/cuda_12.1.0_530.30.02_linux.run'
+    }
+}
+
+# 国内镜像源链接
+CHINA_MIRROR_URLS = {
+    '11.8': {
+        'ubuntu20': 'https://mirrors.tuna.tsinghua.edu.cn/nvidia/cuda/11.8.0/local_installers/cuda_11.8.0_520.61.05_linux.run',
+        'ubuntu22': 'https://mirrors.tuna.tsinghua.edu.cn/nvidia/cuda/11.8.0/local_installers/cuda_11.8.0_520.61.05_linux.run'
+    },
+    '12.0': {
+        'ubuntu20': 'https://mirrors.tuna.tsinghua.edu.cn/nvidia/cuda/12.0.0/local_installers/cuda_12.0.0_525.60.13_linux.run',
+        'ubuntu22': 'https://mirrors.tuna.tsinghua.edu.cn/nvidia/cuda/12.0.0/local_installers/cuda_12.0.0_525.60.13_linux.run'
+    },
+    '12.1': {
+        'ubuntu20': 'https://mirrors.tuna.tsinghua.edu.cn/nvidia/cuda/12.1.0/local_installers/cuda_12.1.0_530.30.02_linux.run',
+        'ubuntu22': 'https://mirrors.tuna.tsinghua.edu.cn/nvidia/cuda/12.1.0/local_installers/cuda_12.1.0_530.30.02_linux.run'
+    }
+}
@@ -1,48 +1,56 @@
-import requests
 import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 from tqdm import tqdm
+from .http_client import get_http_client
+from .installer_cache import InstallerCache
+from .mirror_selector import MirrorSelector
+from .download_catalog import DOWNLOAD_URLS, CHINA_MIRROR_URLS
+from .tracing import span
 
 class CudaDownloader:
-    def __init__(self, use_china_mirror=False):
-        # 原有的官方下载链接
-        self.download_urls = {
-            '11.8': {
-                'ubuntu20': 'https://developer.download.nvidia.com/compute/cuda/11.8.0/local_installers/cuda_11.8.0_520.61.05_linux.run',
-                'ubuntu22': 'https://developer.download.nvidia.com/compute/cuda/11.8.0/local_installers/cuda_11.8.0_520.61.05_linux.run'
-            },
-            '12.0': {
-                'ubuntu20': 'https://developer.download.nvidia.com/compute/cuda/12.0.0/local_installers/cuda_12.0.0_525.60.13_linux.run',
-                'ubuntu22': 'https://developer.download.nvidia.com/compute/cuda/12.0.0/local_installers/cuda_12.0.0_525.60.13_linux.run'
-            },
-            '12.1': {
-                'ubuntu20': 'https://developer.download.nvidia.com/compute/cuda/12.1.0/local_installers/cuda_12.1.0_530.30.02_linux.run',
-                'ubuntu22': 'https://developer.download.nvidia.com/compute/cuda/12.1.0/local_installers/cuda_12.1.0_530.30.02_linux.run'
-            }
-        }
+    def __init__(self, use_china_mirror=False, connections: int = 1,
+                 cache: Optional[InstallerCache] = None, mirror: str = 'official',
+                 rate_limit: Optional[int] = None):
+        # 官方下载链接和国内镜像源链接
+        self.download_urls = DOWNLOAD_URLS
+        self.china_mirror_urls = CHINA_MIRROR_URLS
         
-        # 国内镜像源链接
-        self.china_mirror_urls = {
-            '11.8': {
-                'ubuntu20': 'https://mirrors.tuna.tsinghua.edu.cn/nvidia/cuda/11.8.0/local_installers/cuda_11.8.0_520.61.05_linux.run',
-                'ubuntu22': 'https://mirrors.tuna.tsinghua.edu.cn/nvidia/cuda/11.8.0/local_installers/cuda_11.8.0_520.61.05_linux.run'
-            },
-            '12.0': {
-                'ubuntu20': 'https://mirrors.tuna.tsinghua.edu.cn/nvidia/cuda/12.0.0/local_installers/cuda_12.0.0_525.60.13_linux.run',
-                'ubuntu22': 'https://mirrors.tuna.tsinghua.edu.cn/nvidia/cuda/12.0.0/local_installers/cuda_12.0.0_525.60.13_linux.run'
-            },
-            '12.1': {
-                'ubuntu20': 'https://mirrors.tuna.tsinghua.edu.cn/nvidia/cuda/12.1.0/local_installers/cuda_12.1.0_530.30.02_linux.run',
-                'ubuntu22': 'https://mirrors.tuna.tsinghua.edu.cn/nvidia/cuda/12.1.0/local_installers/cuda_12.1.0_530.30.02_linux.run'
-            }
+        self.mirrors = {
+            'official': self.download_urls,
+            'china': self.china_mirror_urls
         }
         
-        # 根据参数选择使用的URL
+        # 根据参数选择使用的URL；auto模式下测速选择并在出错时切换镜像
         if use_china_mirror:
+            mirror = 'china'
+        self.mirror = mirror
+        if mirror == 'china':
             self.current_urls = self.china_mirror_urls
         else:
             self.current_urls = self.download_urls
+        self.http = get_http_client()
+        self.mirror_selector = MirrorSelector()
+        
+        # 分段并发下载参数
+        self.connections = max(1, connections)
+        self.min_segment_size = 16 * 1024 * 1024  # 每段至少16MB，避免过度切分
+        self.chunk_size = 1024 * 1024
+        self.max_retries = 5
+        self.stall_window = 20.0  # 停滞检测窗口（秒）
+        self.min_speed = 32 * 1024  # 窗口内低于该速度视为停滞，切换镜像
+        
+        # 内容寻址的安装包缓存（可选）
+        self.cache = cache
+        
+        # 带宽上限（字节/秒），所有分段共享
+        self.rate_limiter = _RateLimiter(rate_limit) if rate_limit else None
     
     def download_cuda(self, version: str, ubuntu_version: str, download_dir: Path) -> Optional[Path]:
         """下载CUDA安装包"""
@@ -50,46 +58,486 @@ class CudaDownloader:
             print(f"❌ 不支持的CUDA版本: {version}")
             return None
         
-        url = self.current_urls[version].get(ubuntu_version)
-        if not url:
+        urls = self._candidate_urls(version, ubuntu_version)
+        if not urls:
             print(f"❌ 不支持的Ubuntu版本: {ubuntu_version}")
             return None
         
+        if self.cache:
+            # 各镜像上是同一个文件，任一镜像下载的缓存都可以复用
+            with span('installer_cache_lookup', 'download', version=version) as current:
+                for url in self._candidate_urls(version, ubuntu_version, all_mirrors=True):
+                    cached = self.cache.lookup(version, ubuntu_version, url)
+                    if cached:
+                        current.set(hit=True, bytes=cached.stat().st_size)
+                        print(f"✅ 命中安装包缓存: {cached}")
+                        return cached
+                current.set(hit=False)
+            download_dir = self.cache.staging_dir
+        
+        if self.mirror == 'auto' and len(urls) > 1:
+            print("🌐 探测镜像速度...")
+            with span('mirror_probe', 'download', mirrors=len(urls)):
+                urls = self.mirror_selector.rank(urls) or urls
+            print(f"🚀 使用镜像: {urlparse(urls[0]).netloc}")
+        
+        url = urls[0]
         filename = url.split('/')[-1]
+        
+        download_dir.mkdir(parents=True, exist_ok=True)
         filepath = download_dir / filename
         
         if filepath.exists():
-            print(f"✅ 安装包已存在: {filepath}")
-            return filepath
+            if self._is_complete(url, filepath):
+                print(f"✅ 安装包已存在: {filepath}")
+                if self.cache:
+                    return self.cache.add(version, ubuntu_version, url, filepath)
+                return filepath
+            print(f"⚠️ 安装包不完整，重新下载: {filepath}")
+            filepath.unlink()
         
         print(f"⬇️ 下载CUDA {version}...")
-        return self._download_file(url, filepath)
+        with span('download', 'download', version=version, url=url,
+                  connections=self.connections) as current:
+            result = self._download_file(urls, filepath)
+            if not result:
+                current.set(ok=False)
+                return None
+            current.set(bytes=result[0].stat().st_size)
+        
+        filepath, digest = result
+        if self.cache:
+            return self.cache.add(version, ubuntu_version, url, filepath, digest)
+        return filepath
     
-    def _download_file(self, url: str, filepath: Path) -> Optional[Path]:
-        """下载文件并显示进度"""
+    def _is_complete(self, url: str, filepath: Path) -> bool:
+        """校验已存在的安装包大小是否与远端一致"""
         try:
-            response = requests.get(url, stream=True)
+            _, remote = self._probe_remote(url)
+        except Exception:
+            # 无法联网时信任已存在的文件（新下载的文件只会在完整后才出现）
+            return True
+        return not remote['size'] or filepath.stat().st_size == remote['size']
+    
+    def _candidate_urls(self, version: str, ubuntu_version: str,
+                        all_mirrors: bool = False) -> List[str]:
+        """按镜像模式列出候选下载地址"""
+        names = list(self.mirrors) if all_mirrors or self.mirror == 'auto' else [self.mirror]
+        urls = [self.mirrors[name].get(version, {}).get(ubuntu_version) for name in names]
+        return [url for url in urls if url]
+    
+    def _download_file(self, urls: List[str], filepath: Path) -> Optional[Tuple[Path, str]]:
+        """下载文件并显示进度，支持断点续传和镜像切换；返回文件路径及其SHA-256"""
+        part_path = self._part_path(filepath)
+        
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                digest = self._fetch_to_part(urls, part_path)
+                
+                # 下载完整且校验通过后才移动到最终位置
+                os.replace(part_path, filepath)
+                self._state_path(part_path).unlink(missing_ok=True)
+                
+                print(f"✅ 下载完成: {filepath}")
+                print(f"📈 {self.http.describe_stats()}")
+                return filepath, digest
+                
+            except Exception as e:
+                print(f"⚠️ 下载中断 ({attempt}/{self.max_retries}): {e}")
+                # 下次重试从下一个镜像开始
+                urls = urls[1:] + urls[:1]
+                if attempt < self.max_retries:
+                    time.sleep(self.http.backoff_delay(attempt))
+        
+        print(f"❌ 下载失败，已保留部分文件以便续传: {part_path}")
+        return None
+    
+    def _part_path(self, filepath: Path) -> Path:
+        """下载中的临时文件路径"""
+        return filepath.with_name(filepath.name + '.part')
+    
+    def _state_path(self, part_path: Path) -> Path:
+        """记录续传进度的旁路文件路径"""
+        return part_path.with_name(part_path.name + '.json')
+    
+    def _probe_remote(self, url: str) -> Tuple[str, Dict]:
+        """探测远端文件：返回重定向后的URL以及大小、Range支持和校验头
+
+        部分镜像和CDN拒绝HEAD请求（403/405），此时改用只请求首字节的GET探测；
+        仍被拒绝时不再探测，按不支持Range的服务器单连接下载。
+        """
+        response = self.http.head(url)
+        if response.ok:
+            return response.url, {
+                'size': int(response.headers.get('content-length', 0)),
+                'accept_ranges': response.headers.get('accept-ranges', '').lower() == 'bytes',
+                'etag': response.headers.get('etag'),
+                'last_modified': response.headers.get('last-modified')
+            }
+        if response.status_code in (404, 410):
+            response.raise_for_status()
+        
+        response = self.http.get(url, headers={'Range': 'bytes=0-0'}, stream=True)
+        response.close()
+        if response.status_code in (404, 410):
             response.raise_for_status()
+        
+        remote = {'size': 0, 'accept_ranges': False,
+                  'etag': response.headers.get('etag'),
+                  'last_modified': response.headers.get('last-modified')}
+        content_range = response.headers.get('content-range', '')
+        if response.status_code == 206 and '/' in content_range:
+            # Content-Range: bytes 0-0/<总大小>
+            total = content_range.rsplit('/', 1)[1]
+            if total.isdigit():
+                remote['size'] = int(total)
+                remote['accept_ranges'] = True
+        elif response.ok:
+            remote['size'] = int(response.headers.get('content-length', 0))
+        return response.url, remote
+    
+    def _probe_first(self, urls: List[str]) -> Tuple[List[str], str, Dict]:
+        """依次探测候选地址，返回以首个可用地址开头的列表及其探测结果"""
+        last_error = None
+        for index, url in enumerate(urls):
+            try:
+                final_url, remote = self._probe_remote(url)
+                return urls[index:] + urls[:index], final_url, remote
+            except Exception as e:
+                self.mirror_selector.record_failure(url)
+                print(f"⚠️ 镜像不可用 {urlparse(url).netloc}: {e}")
+                last_error = e
+        raise last_error
+    
+    def _resume_order(self, urls: List[str], part_path: Path) -> List[str]:
+        """已有续传记录时优先使用记录中的镜像，以便校验头一致"""
+        try:
+            with open(self._state_path(part_path)) as f:
+                resume_url = json.load(f).get('url')
+        except (OSError, ValueError):
+            return urls
+        if resume_url in urls:
+            return [resume_url] + [url for url in urls if url != resume_url]
+        return urls
+    
+    def _fetch_to_part(self, urls: List[str], part_path: Path) -> str:
+        """将远端文件下载到.part文件，已下载的部分通过Range续传；返回SHA-256"""
+        urls, final_url, remote = self._probe_first(self._resume_order(urls, part_path))
+        url = urls[0]
+        
+        if not remote['accept_ranges'] or not remote['size']:
+            # 服务器不支持Range，只能从头下载
+            if self.connections > 1:
+                print("⚠️ 服务器不支持分段下载，使用单连接下载")
+            self._state_path(part_path).unlink(missing_ok=True)
+            return self._download_single(final_url, part_path, remote['size'])
+        
+        state = self._load_state(url, part_path, remote)
+        downloaded = sum(segment[2] for segment in state['segments'])
+        if downloaded:
+            print(f"⏩ 从 {downloaded / (1024 * 1024):.1f} MB 处继续下载")
+        
+        # 主镜像使用重定向后的地址；备用镜像在出错或停滞时接替未完成的分段
+        mirrors = [(final_url, url)] + [(fallback, fallback) for fallback in urls[1:]]
+        digest = self._download_segmented(mirrors, part_path, state)
+        
+        if part_path.stat().st_size != remote['size'] or \
+                any(start + done <= end for start, end, done in state['segments']):
+            raise IOError("下载的文件不完整")
+        return digest
+    
+    def _load_state(self, url: str, part_path: Path, remote: Dict) -> Dict:
+        """读取续传进度；远端文件已变化或进度无效时重新开始"""
+        state_path = self._state_path(part_path)
+        
+        if state_path.exists() and part_path.exists():
+            try:
+                with open(state_path) as f:
+                    state = json.load(f)
+                
+                if (state.get('url') == url and
+                        state.get('size') == remote['size'] and
+                        state.get('etag') == remote['etag'] and
+                        state.get('last_modified') == remote['last_modified'] and
+                        part_path.stat().st_size == remote['size']):
+                    return state
+            except (OSError, ValueError):
+                pass
+            print("⚠️ 远端文件已变化或续传记录无效，重新下载")
+        
+        state = {
+            'url': url,
+            'size': remote['size'],
+            'etag': remote['etag'],
+            'last_modified': remote['last_modified'],
+            # 每段记录为 [起始偏移, 结束偏移(含), 已下载字节数]
+            'segments': [[start, end, 0] for start, end in self._split_ranges(remote['size'])]
+        }
+        
+        # 预分配.part文件
+        with open(part_path, 'wb') as f:
+            f.truncate(remote['size'])
+        self._save_state(part_path, state)
+        return state
+    
+    def _save_state(self, part_path: Path, state: Dict):
+        """持久化续传进度（先落盘数据，再原子替换旁路文件）"""
+        fd = os.open(part_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        
+        state_path = self._state_path(part_path)
+        tmp_path = state_path.with_name(state_path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+    
+    def _split_ranges(self, total_size: int) -> List[Tuple[int, int]]:
+        """将文件切分为若干闭区间字节段"""
+        count = max(1, min(self.connections, total_size // self.min_segment_size))
+        segment_size = -(-total_size // count)
+        return [(start, min(start + segment_size, total_size) - 1)
+                for start in range(0, total_size, segment_size)]
+    
+    def _download_single(self, url: str, part_path: Path, expected_size: int) -> str:
+        """单连接流式下载（不可续传），边下载边计算SHA-256"""
+        response = self.http.get(url, stream=True)
+        response.raise_for_status()
+        
+        total_size = int(response.headers.get('content-length', 0)) or expected_size
+        written = 0
+        hasher = hashlib.sha256()
+        
+        with open(part_path, 'wb') as f, tqdm(
+            desc=part_path.name,
+            total=total_size,
+            unit='B',
+            unit_scale=True,
+            unit_divisor=1024,
+        ) as pbar:
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                if chunk:
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    written += len(chunk)
+                    pbar.update(len(chunk))
+                    if self.rate_limiter:
+                        self.rate_limiter.consume(len(chunk))
+        
+        if total_size and written != total_size:
+            raise IOError(f"下载不完整: {written}/{total_size} 字节")
+        return hasher.hexdigest()
+    
+    def _download_segmented(self, mirrors: List[Tuple[str, str]], part_path: Path,
+                            state: Dict) -> str:
+        """分段下载所有未完成的字节段，各段直接写入.part文件的对应位置；返回SHA-256"""
+        pending = [segment for segment in state['segments']
+                   if segment[0] + segment[2] <= segment[1]]
+        
+        if len(pending) > 1:
+            print(f"🔀 使用 {len(pending)} 个连接分段下载")
+        
+        with tqdm(
+            desc=part_path.name,
+            total=state['size'],
+            initial=sum(segment[2] for segment in state['segments']),
+            unit='B',
+            unit_scale=True,
+            unit_divisor=1024,
+        ) as pbar, _DownloadProgress(self, part_path, state, pbar) as progress:
+            if pending:
+                with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+                    futures = [pool.submit(self._download_range, mirrors, part_path, segment, progress)
+                               for segment in pending]
+                    try:
+                        for future in as_completed(futures):
+                            future.result()
+                    except Exception:
+                        # 任一分段失败则通知其余分段尽快退出
+                        progress.stop_event.set()
+                        raise
+                    finally:
+                        progress.save(force=True)
             
-            total_size = int(response.headers.get('content-length', 0))
+            return progress.hash_forward(wait=True)
+    
+    def _download_range(self, mirrors: List[Tuple[str, str]], part_path: Path,
+                        segment: List[int], progress: '_DownloadProgress'):
+        """下载单个字节段；当前镜像出错或停滞时切换到下一个镜像，已下载的字节保留"""
+        last_error = None
+        for index, (url, stats_url) in enumerate(mirrors):
+            try:
+                self._fetch_range(url, stats_url, part_path, segment, progress,
+                                  validate=index == 0,
+                                  # 限速时吞吐本来就低，只在出错时切换镜像
+                                  stall_check=len(mirrors) > 1 and not self.rate_limiter)
+                return
+            except Exception as e:
+                if progress.stop_event.is_set():
+                    return
+                last_error = e
+                self.mirror_selector.record_failure(stats_url)
+                if index + 1 < len(mirrors):
+                    print(f"\n⚠️ 分段 {segment[0]}-{segment[1]} 在 {urlparse(stats_url).netloc} "
+                          f"出错，切换镜像: {e}")
+        raise last_error
+    
+    def _fetch_range(self, url: str, stats_url: str, part_path: Path, segment: List[int],
+                     progress: '_DownloadProgress', validate: bool, stall_check: bool):
+        """从断点处下载单个字节段并原地写入"""
+        start, end, done = segment
+        headers = {'Range': f'bytes={start + done}-{end}'}
+        
+        # 通过If-Range确保续传的仍然是同一个文件；校验头只对记录它的镜像有效
+        state = progress.state
+        etag = state.get('etag')
+        if validate:
+            if etag and not etag.startswith('W/'):
+                headers['If-Range'] = etag
+            elif state.get('last_modified'):
+                headers['If-Range'] = state['last_modified']
+        
+        began = time.monotonic()
+        window_start, window_bytes = began, 0
+        
+        with self.http.get(url, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise RuntimeError(f"服务器未返回分段内容 (HTTP {response.status_code})")
+            if not validate:
+                total = response.headers.get('content-range', '').rpartition('/')[2]
+                if total != str(state['size']):
+                    raise IOError("镜像上的文件大小不一致")
             
-            with open(filepath, 'wb') as f, tqdm(
-                desc=filepath.name,
-                total=total_size,
-                unit='B',
-                unit_scale=True,
-                unit_divisor=1024,
-            ) as pbar:
-                for chunk in response.iter_content(chunk_size=8192):
+            fd = os.open(part_path, os.O_WRONLY)
+            try:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if progress.stop_event.is_set():
+                        return
                     if chunk:
-                        f.write(chunk)
-                        pbar.update(len(chunk))
-            
-            print(f"✅ 下载完成: {filepath}")
-            return filepath
-            
-        except Exception as e:
-            print(f"❌ 下载失败: {e}")
-            if filepath.exists():
-                filepath.unlink()
-            return None
\ No newline at end of file
+                        chunk = chunk[:end + 1 - (start + segment[2])]
+                        os.pwrite(fd, chunk, start + segment[2])
+                        progress.advance(segment, len(chunk))
+                        progress.hash_forward()
+                        window_bytes += len(chunk)
+                        if self.rate_limiter:
+                            self.rate_limiter.consume(len(chunk))
+                    
+                    if stall_check:
+                        now = time.monotonic()
+                        if now - window_start >= self.stall_window:
+                            if window_bytes / (now - window_start) < self.min_speed:
+                                raise IOError("传输停滞")
+                            window_start, window_bytes = now, 0
+            finally:
+                os.close(fd)
+        
+        if start + segment[2] != end + 1:
+            raise IOError(f"分段 {start}-{end} 不完整: 仅收到 {segment[2]} 字节")
+        
+        self.mirror_selector.record(stats_url, segment[2] - done, time.monotonic() - began)
+
+class _DownloadProgress:
+    """分段下载的共享进度：定期把已下载字节数写入旁路文件，并对连续前缀做流式哈希"""
+    
+    def __init__(self, downloader: CudaDownloader, part_path: Path, state: Dict, pbar: tqdm):
+        self.downloader = downloader
+        self.part_path = part_path
+        self.state = state
+        self.pbar = pbar
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.save_interval = 2.0
+        self.last_save = time.monotonic()
+        # fsync大文件耗时较长，在独立的锁下进行，不阻塞各分段记录进度
+        self.save_lock = threading.Lock()
+        self.generation = 0
+        self.saved_generation = 0
+        
+        # 哈希只能按顺序进行：记录已哈希到的偏移，随连续前缀的增长向前推进
+        self.hasher = hashlib.sha256()
+        self.hashed_upto = 0
+        self.hash_lock = threading.Lock()
+        self.fd = os.open(part_path, os.O_RDONLY)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        os.close(self.fd)
+    
+    def advance(self, segment: List[int], size: int):
+        """记录某一分段新写入的字节"""
+        with self.lock:
+            segment[2] += size
+            self.pbar.update(size)
+        self.save()
+    
+    def save(self, force: bool = False):
+        """按时间间隔持久化进度"""
+        with self.lock:
+            if not force and time.monotonic() - self.last_save < self.save_interval:
+                return
+            self.last_save = time.monotonic()
+            self.generation += 1
+            generation = self.generation
+            # 复制进度后再fsync：副本记录的字节在fsync前均已写入
+            state = dict(self.state, segments=[list(segment) for segment in self.state['segments']])
+        
+        with self.save_lock:
+            # 并发保存时较旧的进度不能覆盖较新的
+            if generation <= self.saved_generation:
+                return
+            self.downloader._save_state(self.part_path, state)
+            self.saved_generation = generation
+    
+    def hash_forward(self, wait: bool = False) -> Optional[str]:
+        """哈希已连续下载完成的前缀（刚写入的数据仍在页缓存中，无需再次读盘）"""
+        if not self.hash_lock.acquire(blocking=wait):
+            return None
+        try:
+            with self.lock:
+                end = self._contiguous_end()
+            while self.hashed_upto < end:
+                data = os.pread(self.fd, min(end - self.hashed_upto, 8 * 1024 * 1024),
+                                self.hashed_upto)
+                if not data:
+                    break
+                self.hasher.update(data)
+                self.hashed_upto += len(data)
+            return self.hasher.hexdigest()
+        finally:
+            self.hash_lock.release()
+    
+    def _contiguous_end(self) -> int:
+        """从文件开头起连续下载完成的字节数"""
+        end = 0
+        for start, stop, done in sorted(self.state['segments']):
+            if start != end:
+                break
+            end = start + done
+            if end <= stop:
+                break
+        return end
+
+class _RateLimiter:
+    """令牌桶限速，多个分段共享同一个带宽上限"""
+    
+    def __init__(self, rate: int):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def consume(self, size: int):
+        """取出size字节的令牌，不足时等待"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= size
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
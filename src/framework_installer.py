@@ -1,6 +1,11 @@
 import subprocess
 import sys
-from typing import Optional
+from typing import List, Optional
+from .wheelhouse import Wheelhouse
+from .tracing import span
+
+# 安装参数中带值的pip选项
+PIP_VALUE_OPTIONS = ('--index-url', '-i', '--extra-index-url', '--find-links', '-f')
 
 class FrameworkInstaller:
     def __init__(self):
@@ -15,20 +20,18 @@ class FrameworkInstaller:
             '12.0': 'tensorflow[and-cuda]',
             '12.1': 'tensorflow[and-cuda]'
         }
+        
+        # 已下载的wheel按(框架, CUDA版本, Python ABI, 索引)保存在本地，重复安装无需联网
+        self.wheelhouse = Wheelhouse()
     
     def install_pytorch(self, cuda_version: str, mirror: str = 'official') -> bool:
-        """安装PyTorch"""
+        """安装PyTorch（mirror为official、china或auto）"""
         if cuda_version not in self.pytorch_versions:
             print(f"❌ 不支持的CUDA版本: {cuda_version}")
             return False
         
-        cmd = f"pip install {self.pytorch_versions[cuda_version]}"
-        if mirror == 'china':
-            cmd += " -i https://pypi.tuna.tsinghua.edu.cn/simple"
-        
         try:
-            result = subprocess.run(cmd.split(), capture_output=True, text=True)
-            return result.returncode == 0
+            return self._install('pytorch', cuda_version, self.pytorch_versions[cuda_version], mirror)
         except Exception as e:
             print(f"❌ PyTorch安装失败: {e}")
             return False
@@ -39,13 +42,78 @@ class FrameworkInstaller:
             print(f"❌ 不支持的CUDA版本: {cuda_version}")
             return False
         
-        cmd = f"pip install {self.tensorflow_versions[cuda_version]}"
-        if mirror == 'china':
-            cmd += " -i https://pypi.tuna.tsinghua.edu.cn/simple"
-        
         try:
-            result = subprocess.run(cmd.split(), capture_output=True, text=True)
-            return result.returncode == 0
+            return self._install('tensorflow', cuda_version, self.tensorflow_versions[cuda_version],
+                                 mirror)
         except Exception as e:
             print(f"❌ TensorFlow安装失败: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def sync_wheels(self, framework: str, cuda_version: str, mirror: str = 'official') -> bool:
+        """把框架及其依赖的wheel下载到本地仓库"""
+        versions = self.pytorch_versions if framework == 'pytorch' else self.tensorflow_versions
+        if cuda_version not in versions:
+            print(f"❌ 不支持的CUDA版本: {cuda_version}")
+            return False
+        
+        packages, index_args = self._split_spec(versions[cuda_version], mirror)
+        return self.wheelhouse.sync(framework, cuda_version, packages, index_args)
+    
+    def wheel_path(self, framework: str, cuda_version: str, mirror: str = 'official'):
+        """该框架在给定镜像下对应的本地wheel仓库目录"""
+        versions = self.pytorch_versions if framework == 'pytorch' else self.tensorflow_versions
+        _, index_args = self._split_spec(versions[cuda_version], mirror)
+        return self.wheelhouse.path(framework, cuda_version, index_args)
+    
+    def _install(self, framework: str, cuda_version: str, spec: str, mirror: str) -> bool:
+        """优先从本地wheel仓库离线安装；仓库不完整时先下载到仓库再安装"""
+        packages, index_args = self._split_spec(spec, mirror)
+        
+        with span('framework_install', 'framework', framework=framework,
+                  cuda_version=cuda_version) as current:
+            if self.wheelhouse.is_complete(framework, cuda_version, packages, index_args):
+                print(f"📦 使用本地wheel仓库: "
+                      f"{self.wheelhouse.path(framework, cuda_version, index_args)}")
+                current.set(source='wheelhouse')
+                if self.wheelhouse.install(framework, cuda_version, packages, index_args):
+                    return True
+            elif self.wheelhouse.sync(framework, cuda_version, packages, index_args):
+                current.set(source='wheelhouse_synced')
+                if self.wheelhouse.install(framework, cuda_version, packages, index_args):
+                    return True
+            
+            # 仓库不可用时退回直接从远程索引安装
+            current.set(source='remote')
+            with span('pip_install', 'framework', offline=False):
+                result = subprocess.run(self.wheelhouse.pip + ['install'] + packages + index_args,
+                                        capture_output=True, text=True)
+            current.set(ok=result.returncode == 0)
+            return result.returncode == 0
+    
+    def resolve_mirror(self, mirror: str) -> str:
+        """框架索引只有official和china两种；auto时沿用下载CUDA时测得较快的一方"""
+        if mirror != 'auto':
+            return mirror
+        from .download_catalog import DOWNLOAD_URLS, CHINA_MIRROR_URLS
+        from .mirror_selector import MirrorSelector
+        groups = {name: [url for distros in catalog.values() for url in distros.values()]
+                  for name, catalog in (('official', DOWNLOAD_URLS), ('china', CHINA_MIRROR_URLS))}
+        return MirrorSelector().preferred(groups, default='official')
+    
+    def _split_spec(self, spec: str, mirror: str):
+        """把安装参数拆分为包列表和索引参数"""
+        args = spec.split()
+        if self.resolve_mirror(mirror) == 'china':
+            args += ['-i', 'https://pypi.tuna.tsinghua.edu.cn/simple']
+        
+        packages: List[str] = []
+        index_args: List[str] = []
+        iterator = iter(args)
+        for arg in iterator:
+            if arg in PIP_VALUE_OPTIONS:
+                index_args += [arg, next(iterator)]
+            elif arg.startswith('-'):
+                index_args.append(arg)
+            else:
+                packages.append(arg)
+        return packages, index_args
@@ -0,0 +1,112 @@
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Dict, Optional
+
+class HttpClient:
+    """共享的HTTP客户端：连接池复用、有界超时以及带抖动的指数退避重试"""
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, pool_size: int = 32, connect_timeout: float = 10,
+                 read_timeout: float = 60, max_retries: int = 4,
+                 backoff_base: float = 0.5, backoff_max: float = 30):
+        self.session = requests.Session()
+        # 重试由本类统一处理，适配器本身不重试
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.adapter = adapter
+
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'retries': 0, 'failures': 0}
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('HEAD', url, **kwargs)
+
+    def request(self, method: str, url: str, retries: Optional[int] = None,
+                **kwargs) -> requests.Response:
+        """发送请求；连接错误、超时和可重试的状态码按退避策略重试
+
+        流式响应只重试建立连接和读取响应头的阶段，传输中断由调用方续传。
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        max_retries = self.max_retries if retries is None else retries
+
+        for attempt in range(max_retries + 1):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._count('failures')
+                if attempt >= max_retries:
+                    raise
+                self._count('retries')
+                time.sleep(self.backoff_delay(attempt))
+                continue
+
+            self._count('requests')
+            if response.status_code in self.RETRY_STATUS and attempt < max_retries:
+                delay = self._retry_after(response) or self.backoff_delay(attempt)
+                response.close()
+                self._count('retries')
+                time.sleep(delay)
+                continue
+            return response
+
+    def backoff_delay(self, attempt: int) -> float:
+        """全抖动指数退避：在 [0, base * 2^attempt] 内随机等待"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get_stats(self) -> Dict[str, int]:
+        """返回请求、重试和连接复用计数"""
+        with self.lock:
+            stats = dict(self.counters)
+
+        # urllib3连接池记录了新建连接数和请求数，两者之差即复用次数
+        new_connections = pooled_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                new_connections += pool.num_connections
+                pooled_requests += pool.num_requests
+        stats['connections'] = new_connections
+        stats['reused_connections'] = max(0, pooled_requests - new_connections)
+        return stats
+
+    def describe_stats(self) -> str:
+        stats = self.get_stats()
+        return (f"HTTP请求 {stats['requests']} 次，新建连接 {stats['connections']} 个，"
+                f"复用连接 {stats['reused_connections']} 次，重试 {stats['retries']} 次")
+
+    def _retry_after(self, response: requests.Response) -> Optional[float]:
+        value = response.headers.get('retry-after')
+        if value and value.isdigit():
+            return min(float(value), self.backoff_max)
+        return None
+
+    def _count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_http_client() -> HttpClient:
+    """获取进程内共享的HTTP客户端"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
@@ -0,0 +1,138 @@
+import os
+import json
+import fcntl
+import hashlib
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Optional
+
+class InstallerCache:
+    """按SHA-256内容寻址的CUDA安装包缓存"""
+
+    def __init__(self):
+        self.cache_dir = Path.home() / '.deeplearningmate' / 'installers'
+        self.blob_dir = self.cache_dir / 'sha256'
+        self.staging_dir = self.cache_dir / 'staging'
+        self.index_file = self.cache_dir / 'index.json'
+        self.lock_file = self.cache_dir / 'index.lock'
+
+    def lookup(self, version: str, distro: str, url: str) -> Optional[Path]:
+        """查找缓存的安装包，命中时校验内容完整性"""
+        key = self._make_key(version, distro, url)
+        entry = self._load_index().get(key)
+        if not entry:
+            return None
+
+        # 安装包随后会以root权限执行，每次命中都完整校验内容；哈希耗时较长，不持有索引锁
+        blob = self.blob_dir / entry['sha256']
+        valid = blob.exists() and self._verify(blob, entry)
+
+        with self._index_lock():
+            index = self._load_index()
+            current = index.get(key)
+            if valid:
+                if current and current['sha256'] == entry['sha256']:
+                    current['last_used'] = datetime.now().isoformat()
+                    self._save_index(index)
+                return blob
+
+            # 缓存损坏或丢失：移除条目，交由调用方重新下载
+            print(f"⚠️ 缓存的安装包已损坏，将重新下载: {blob.name}")
+            blob.unlink(missing_ok=True)
+            if current and current['sha256'] == entry['sha256']:
+                del index[key]
+                self._save_index(index)
+            return None
+
+    def add(self, version: str, distro: str, url: str, path: Path,
+            digest: Optional[str] = None) -> Path:
+        """将下载完成的文件移入缓存，返回缓存中的路径"""
+        if digest is None:
+            digest = self.hash_file(path)
+
+        blob = self.blob_dir / digest
+        with self._index_lock():
+            if blob.exists():
+                path.unlink()
+            else:
+                self.blob_dir.mkdir(parents=True, exist_ok=True)
+                os.replace(path, blob)
+
+            stat = blob.stat()
+            index = self._load_index()
+            index[self._make_key(version, distro, url)] = {
+                'sha256': digest,
+                'version': version,
+                'distro': distro,
+                'url': url,
+                'filename': url.split('/')[-1],
+                'size': stat.st_size,
+                'added': datetime.now().isoformat(),
+                'last_used': datetime.now().isoformat()
+            }
+            self._save_index(index)
+        return blob
+
+    def entries(self) -> Dict[str, Dict]:
+        """返回缓存索引中的所有条目"""
+        return self._load_index()
+
+    def remove(self, digest: str) -> int:
+        """删除一个安装包及引用它的索引条目，返回释放的字节数"""
+        blob = self.blob_dir / digest
+        with self._index_lock():
+            freed = blob.stat().st_size if blob.exists() else 0
+            blob.unlink(missing_ok=True)
+
+            index = self._load_index()
+            self._save_index({key: entry for key, entry in index.items()
+                              if entry['sha256'] != digest})
+        return freed
+
+    def disk_usage(self) -> int:
+        """缓存的安装包占用的字节数（相同内容只计一次）"""
+        sizes = {entry['sha256']: entry['size'] for entry in self._load_index().values()}
+        return sum(sizes.values())
+
+    @staticmethod
+    def hash_file(path: Path) -> str:
+        """计算文件的SHA-256"""
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(8 * 1024 * 1024), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def _verify(self, blob: Path, entry: Dict) -> bool:
+        """按SHA-256校验缓存文件；大小不符时无需读取内容"""
+        if blob.stat().st_size != entry['size']:
+            return False
+        print(f"🔍 校验安装包: {entry['filename']}")
+        return self.hash_file(blob) == entry['sha256']
+
+    def _make_key(self, version: str, distro: str, url: str) -> str:
+        return f"{version}|{distro}|{url}"
+
+    @contextmanager
+    def _index_lock(self):
+        """跨进程互斥索引的读-改-写，后台预取和前台安装同时运行时不丢失更新"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_file, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _load_index(self) -> Dict:
+        if not self.index_file.exists():
+            return {}
+        try:
+            with open(self.index_file) as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def _save_index(self, index: Dict):
+        tmp_file = self.index_file.with_name(self.index_file.name + '.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_file, self.index_file)
@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+class TransactionJournal:
+    """事务的追加式日志：每行一条带CRC32校验的JSON记录
+
+    记录只追加不改写；崩溃时最多在末尾留下一条不完整的记录，
+    读取时在第一条校验失败的记录处停止即可。
+    """
+
+    # 表示事务已结束的状态
+    TERMINAL_STATUSES = ('committed', 'rolled_back')
+
+    def __init__(self, path: Path, sync_interval: float = 0.5):
+        self.path = path
+        self.sync_interval = sync_interval  # 普通记录按时间间隔合并fsync
+        self._file = None
+        self._last_sync = 0.0
+
+    def append(self, record: Dict, sync: bool = False):
+        """追加一条记录；sync=True或距上次落盘超过间隔时立即fsync"""
+        if self._file is None:
+            self._open()
+
+        record.setdefault('time', time.time())
+        payload = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self._file.write(b'%08x %s\n' % (zlib.crc32(payload), payload))
+        self._file.flush()
+
+        if sync or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def _open(self):
+        """打开日志准备追加；先截掉崩溃留下的不完整尾部，保证新记录可被读到"""
+        if self.path.exists():
+            _, valid_length = self._scan(self.path)
+            if valid_length < self.path.stat().st_size:
+                os.truncate(self.path, valid_length)
+        self._file = open(self.path, 'ab')
+
+    def sync(self):
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    @classmethod
+    def read(cls, path: Path) -> List[Dict]:
+        """读取所有校验通过的记录，遇到损坏的记录即停止"""
+        return cls._scan(path)[0]
+
+    @staticmethod
+    def _scan(path: Path) -> Tuple[List[Dict], int]:
+        """返回有效记录以及有效部分的字节长度"""
+        records = []
+        valid_length = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                checksum, _, payload = line[:-1].partition(b' ')
+                try:
+                    if int(checksum, 16) != zlib.crc32(payload):
+                        break
+                    records.append(json.loads(payload))
+                except ValueError:
+                    break
+                valid_length += len(line)
+        return records, valid_length
+
+    @classmethod
+    def replay(cls, path: Path) -> Optional[Dict]:
+        """重放日志，得到事务的当前状态"""
+        state = None
+        for record in cls.read(path):
+            kind = record.get('type')
+            if kind == 'begin':
+                state = {
+                    'id': record['id'],
+                    'operation': record['operation'],
+                    'start_time': record['start_time'],
+                    'pid': record.get('pid'),
+                    'status': 'active',
+                    'rollback_actions': [],
+                    'backups': record.get('backups', {})
+                }
+            elif state is None:
+                continue
+            elif kind == 'action':
+                state['rollback_actions'].append(record['action'])
+            elif kind == 'status':
+                state['status'] = record['status']
+                if record['status'] in cls.TERMINAL_STATUSES:
+                    state['end_time'] = record.get('end_time')
+        return state
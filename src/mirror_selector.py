@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+from .http_client import get_http_client
+
+class MirrorSelector:
+    """并发测速选择最快的镜像，并记录各镜像的历史吞吐"""
+
+    def __init__(self, sample_size: int = 512 * 1024):
+        self.stats_file = Path.home() / '.deeplearningmate' / 'mirror_stats.json'
+        self.sample_size = sample_size
+        self.timeout = (5, 10)  # 测速使用较短超时且不重试
+        self.http = get_http_client()
+        self.alpha = 0.3  # 历史吞吐的指数滑动平均系数
+        self.lock = threading.Lock()
+
+    def rank(self, urls: List[str]) -> List[str]:
+        """并发探测所有镜像，按预估吞吐从高到低排序；不可用或文件不一致的镜像被剔除"""
+        with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+            results = list(pool.map(self._probe, urls))
+
+        # 以第一个可访问镜像（官方源优先）的文件大小为准
+        sizes = [result['size'] for result in results if result]
+        expected_size = sizes[0] if sizes else None
+
+        stats = self._load_stats()
+        scored = []
+        for url, result in zip(urls, results):
+            host = self._host(url)
+            if result is None:
+                print(f"  ❌ {host}: 不可用")
+                continue
+            if result['size'] != expected_size:
+                print(f"  ⚠️ {host}: 文件大小不一致，已跳过")
+                continue
+
+            # 探测样本较小，结合历史吞吐平滑噪声
+            history = stats.get(host, {}).get('throughput')
+            score = result['throughput'] if history is None else (result['throughput'] + history) / 2
+            scored.append((score, url))
+            print(f"  🌐 {host}: {result['latency'] * 1000:.0f} ms, "
+                  f"{result['throughput'] / (1024 * 1024):.1f} MB/s")
+
+        return [url for _, url in sorted(scored, key=lambda item: item[0], reverse=True)]
+
+    def record(self, url: str, size: int, seconds: float):
+        """记录一次实际传输的吞吐"""
+        if size <= 0 or seconds <= 0:
+            return
+        with self.lock:
+            stats = self._load_stats()
+            entry = stats.setdefault(self._host(url), {})
+            throughput = size / seconds
+            previous = entry.get('throughput')
+            entry['throughput'] = throughput if previous is None else \
+                self.alpha * throughput + (1 - self.alpha) * previous
+            entry['updated'] = datetime.now().isoformat()
+            self._save_stats(stats)
+
+    def preferred(self, groups: Dict[str, List[str]], default: str) -> str:
+        """按历史吞吐选择较快的一组镜像（如official/china），没有记录时返回default"""
+        stats = self._load_stats()
+        best, best_throughput = default, 0.0
+        for name, urls in groups.items():
+            throughput = max((stats.get(self._host(url), {}).get('throughput') or 0.0
+                              for url in urls), default=0.0)
+            if throughput > best_throughput:
+                best, best_throughput = name, throughput
+        return best
+
+    def record_failure(self, url: str):
+        """记录一次镜像故障"""
+        with self.lock:
+            stats = self._load_stats()
+            entry = stats.setdefault(self._host(url), {})
+            entry['failures'] = entry.get('failures', 0) + 1
+            entry['updated'] = datetime.now().isoformat()
+            self._save_stats(stats)
+
+    def _probe(self, url: str) -> Optional[Dict]:
+        """测量单个镜像的延迟和一小段数据的下载吞吐"""
+        try:
+            start = time.monotonic()
+            head = self.http.head(url, timeout=self.timeout, retries=0)
+            head.raise_for_status()
+            latency = time.monotonic() - start
+
+            start = time.monotonic()
+            received = 0
+            headers = {'Range': f'bytes=0-{self.sample_size - 1}'}
+            with self.http.get(head.url, headers=headers, stream=True,
+                               timeout=self.timeout, retries=0) as response:
+                response.raise_for_status()
+                # 服务器忽略Range时也只读取样本大小的数据
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    received += len(chunk)
+                    if received >= self.sample_size:
+                        break
+            elapsed = max(time.monotonic() - start, 1e-6)
+
+            return {
+                'latency': latency,
+                'throughput': received / elapsed,
+                'size': int(head.headers.get('content-length', 0))
+            }
+        except Exception:
+            return None
+
+    def _host(self, url: str) -> str:
+        return urlparse(url).netloc
+
+    def _load_stats(self) -> Dict:
+        if not self.stats_file.exists():
+            return {}
+        try:
+            with open(self.stats_file) as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def _save_stats(self, stats: Dict):
+        self.stats_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.stats_file.with_name(self.stats_file.name + '.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(stats, f, indent=2)
+        os.replace(tmp_file, self.stats_file)
@@ -1,7 +1,14 @@
 import psutil
 import time
+import glob
+import os
+import threading
 import subprocess
 import json
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Tuple
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from .transaction_manager import TransactionManager
@@ -10,55 +17,193 @@ class CudaChangeHandler(FileSystemEventHandler):
     def __init__(self, monitor):
         self.monitor = monitor
     
-    def on_modified(self, event):
+    def on_any_event(self, event):
+        # 只读访问不会改变工具包状态
+        if event.event_type in ('opened', 'closed_no_write'):
+            return
         if 'cuda' in event.src_path.lower():
-            print(f"🔍 检测到CUDA目录变化: {event.src_path}")
-            self.monitor._check_system_health()
+            # 只记录事件，健康检查由防抖定时器在一批事件结束后统一触发
+            self.monitor._schedule_check()
 
 class SystemMonitor:
     def __init__(self):
         self.transaction_manager = TransactionManager()
         self.monitoring = False
+        self.install_base = '/usr/local'
+        self.debounce_seconds = 5.0  # 事件停止这么久之后才检查一次
+        
+        self.observer = None
+        self.watches = {}  # 被监控的目录 -> watchdog句柄
+        self.lock = threading.Lock()
+        self.timer = None
+        self.pending_events = 0
+        
+        # 分级健康检查：廉价的stat探测频繁运行，nvcc探测只在前者结果变化时运行
+        self.min_interval = 10
+        self.max_interval = 300
+        self.interval = self.min_interval
+        self.failure_threshold = 3  # 连续失败这么多次才自动恢复
+        self.probe_timeout = 10
+        self.last_signature = None
+        self.last_full_ok = None
+        self.consecutive_failures = 0
+        self.health_history = deque(maxlen=200)
+        self.check_lock = threading.Lock()  # 定时检查和事件触发的检查不并发执行
+        self.health_log = Path.home() / '.deeplearningmate' / 'monitor_health.jsonl'
     
     def start_monitoring(self):
         """开始监控系统状态"""
         self.monitoring = True
         
-        # 监控CUDA目录变化
-        observer = Observer()
-        observer.schedule(CudaChangeHandler(self), '/usr/local', recursive=True)
-        observer.start()
+        # 只监控CUDA软链接所在目录和各工具包的根目录（均不递归），避免耗尽inotify watch
+        self.observer = Observer()
+        self._sync_watches()
+        self.observer.start()
         
         try:
             while self.monitoring:
                 self._check_system_health()
-                time.sleep(30)  # 每30秒检查一次
+                time.sleep(self.interval)  # 稳定时逐步拉长间隔，变化后缩短
         except KeyboardInterrupt:
-            observer.stop()
-        observer.join()
+            self.observer.stop()
+        self.observer.join()
     
-    def _check_system_health(self):
-        """检查系统健康状态"""
-        # 检查CUDA是否正常
-        try:
-            result = subprocess.run(['nvcc', '--version'], 
-                                  capture_output=True, text=True, timeout=10)
-            if result.returncode != 0:
-                print("⚠️ 检测到CUDA异常，尝试自动恢复...")
-                self._auto_recover()
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            print("⚠️ CUDA命令无响应，尝试自动恢复...")
+    def _watch_targets(self):
+        """需要监控的目录：安装根目录（软链接变化、新增版本）以及每个工具包的根目录和bin"""
+        targets = {self.install_base}
+        for root in glob.glob(os.path.join(self.install_base, 'cuda-*')):
+            if os.path.isdir(root) and not os.path.islink(root):
+                targets.add(root)
+                if os.path.isdir(os.path.join(root, 'bin')):
+                    targets.add(os.path.join(root, 'bin'))
+        return targets
+    
+    def _sync_watches(self):
+        """新增或删除工具包后更新监控的目录"""
+        targets = self._watch_targets()
+        for path in set(self.watches) - targets:
+            self.observer.unschedule(self.watches.pop(path))
+        for path in targets - set(self.watches):
+            try:
+                self.watches[path] = self.observer.schedule(CudaChangeHandler(self), path,
+                                                            recursive=False)
+            except OSError as e:
+                print(f"⚠️ 无法监控 {path}: {e}")
+    
+    def _schedule_check(self, events: int = 1):
+        """合并防抖窗口内的事件：每次事件都重置定时器，窗口结束后只检查一次"""
+        with self.lock:
+            self.pending_events += events
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.debounce_seconds, self._on_events_settled)
+            self.timer.daemon = True
+            self.timer.start()
+    
+    def _on_events_settled(self):
+        with self.lock:
+            count, self.pending_events = self.pending_events, 0
+            self.timer = None
+        
+        # dlmate自身正在切换/安装时文件变化是预期的，等事务结束后再检查
+        active = self.transaction_manager.active_transactions()
+        if active:
+            self._schedule_check(count)
+            return
+        
+        print(f"🔍 检测到CUDA目录变化（{count} 个事件）")
+        if self.observer is not None:
+            self._sync_watches()
+        self._check_system_health()
+    
+    def _check_system_health(self) -> Optional[bool]:
+        """分级检查系统健康状态，返回是否健康（事务进行中时不检查，返回None）"""
+        # 事务进行中时CUDA可能暂时不完整，不做判断
+        with self.check_lock:
+            if self.transaction_manager.active_transactions():
+                return None
+            
+            started = time.monotonic()
+            healthy, signature = self._cheap_probe()
+            changed = signature != self.last_signature
+            tier = 'stat'
+            
+            # 只有软链接指向或nvcc发生变化、或上次完整检查未通过时才运行nvcc
+            if healthy and (changed or not self.last_full_ok):
+                tier = 'nvcc'
+                healthy = self._full_probe(signature[0])
+                self.last_full_ok = healthy
+            self.last_signature = signature
+            
+            self._record_check(tier, healthy, time.monotonic() - started)
+            
+            if healthy:
+                self.consecutive_failures = 0
+                self.interval = self.min_interval if changed else \
+                    min(self.interval * 2, self.max_interval)
+                return True
+            
+            self.consecutive_failures += 1
+            self.interval = self.min_interval
+            print(f"⚠️ CUDA健康检查失败（连续 {self.consecutive_failures}/"
+                  f"{self.failure_threshold} 次）")
+            if self.consecutive_failures < self.failure_threshold:
+                return False
+            
+            print("⚠️ 检测到CUDA持续异常，尝试自动恢复...")
             self._auto_recover()
+            self.consecutive_failures = 0
+            self.last_signature = None
+            self.last_full_ok = None
+            return False
+    
+    def _cheap_probe(self) -> Tuple[bool, Optional[tuple]]:
+        """只用stat检查软链接和nvcc，返回(是否正常, 状态签名)"""
+        toolkit = os.path.realpath(os.path.join(self.install_base, 'cuda'))
+        nvcc = os.path.join(toolkit, 'bin', 'nvcc')
+        try:
+            stat = os.stat(nvcc)
+        except OSError:
+            return False, (toolkit, None)
+        
+        signature = (toolkit, stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_mode)
+        return os.access(nvcc, os.X_OK), signature
+    
+    def _full_probe(self, toolkit: str) -> bool:
+        """运行nvcc --version确认工具链可用"""
+        try:
+            result = subprocess.run([os.path.join(toolkit, 'bin', 'nvcc'), '--version'],
+                                    capture_output=True, text=True, timeout=self.probe_timeout)
+            return result.returncode == 0
+        except (subprocess.TimeoutExpired, OSError):
+            return False
+    
+    def _record_check(self, tier: str, healthy: bool, latency: float):
+        """记录每次检查的级别、结果和耗时"""
+        record = {
+            'time': datetime.now().isoformat(),
+            'tier': tier,
+            'healthy': healthy,
+            'latency_ms': round(latency * 1000, 2),
+            'interval': self.interval
+        }
+        self.health_history.append(record)
+        
+        if not self.health_log.parent.is_dir():
+            return
+        try:
+            # 日志超过1MB时轮转，只保留一份旧日志
+            if self.health_log.exists() and self.health_log.stat().st_size > 1024 * 1024:
+                os.replace(self.health_log, self.health_log.with_name(self.health_log.name + '.1'))
+            with open(self.health_log, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError:
+            pass
     
     def _auto_recover(self):
         """自动恢复"""
-        # 查找最近的成功备份
-        backup_files = list(self.transaction_manager.backup_dir.glob('*.json'))
-        for backup_file in sorted(backup_files, key=lambda x: x.stat().st_mtime, reverse=True):
-            with open(backup_file) as f:
-                backup_data = json.load(f)
-            
-            if backup_data.get('status') == 'committed':
-                print(f"🔄 恢复到备份: {backup_data['operation']}")
-                self.transaction_manager._rollback_transaction(backup_data['id'])
-                break
\ No newline at end of file
+        # 从事务索引中查找最近的成功备份
+        backup_data = self.transaction_manager.store.latest('committed')
+        if backup_data:
+            print(f"🔄 恢复到备份: {backup_data['operation']}")
+            self.transaction_manager._rollback_transaction(backup_data['id'])
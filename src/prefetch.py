@@ -0,0 +1,127 @@
+import os
+import sys
+import fcntl
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+from .config import load_config, parse_size
+from .downloader import CudaDownloader
+from .installer_cache import InstallerCache
+from .cache_manager import CacheManager
+from .version_detector import CudaVersionDetector
+
+class Prefetcher:
+    """预先把目录中的CUDA安装包下载到本地缓存，使后续安装不再受网络限制"""
+
+    def __init__(self, mirror: str = 'auto', connections: Optional[int] = None,
+                 rate_limit: Optional[int] = None):
+        settings = load_config().get('prefetch', {})
+        self.mirror = mirror
+        self.connections = connections or settings.get('connections', 2)
+        self.rate_limit = rate_limit if rate_limit is not None else \
+            parse_size(settings.get('bandwidth_limit'))
+
+        self.state_dir = Path.home() / '.deeplearningmate'
+        self.pid_file = self.state_dir / 'prefetch.pid'
+        self.log_file = self.state_dir / 'prefetch.log'
+
+    def catalogued_versions(self) -> List[str]:
+        """配置文件中登记的CUDA版本"""
+        return [str(version) for version in load_config().get('cuda_versions', {})]
+
+    def run(self, versions: Optional[List[str]] = None) -> Dict[str, bool]:
+        """以低优先级依次预取各版本的安装包；已有预取进程在运行时直接返回"""
+        # 运行期间持有PID文件上的锁，进程退出（包括崩溃）时锁自动释放
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.pid_file, 'a+') as pid_lock:
+            try:
+                fcntl.flock(pid_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                print(f"⚠️ 预取任务已在运行 (PID: {self.running_pid()})")
+                return {}
+            pid_lock.truncate(0)
+            pid_lock.write(str(os.getpid()))
+            pid_lock.flush()
+            try:
+                return self._run(versions)
+            finally:
+                self.pid_file.unlink(missing_ok=True)
+    
+    def _run(self, versions: Optional[List[str]]) -> Dict[str, bool]:
+        self._lower_priority()
+
+        versions = versions or self.catalogued_versions()
+        detector = CudaVersionDetector()
+        ubuntu_version = detector.detect_ubuntu_version()
+        cache = InstallerCache()
+        # 当前激活版本的工具包缓存不能被后台预取淘汰
+        manager = CacheManager(installers=cache,
+                               active_version=detector.get_current_cuda_version())
+        downloader = CudaDownloader(connections=self.connections, cache=cache,
+                                    mirror=self.mirror, rate_limit=self.rate_limit)
+
+        results = {}
+        for version in versions:
+            if version not in downloader.download_urls:
+                print(f"⚠️ 跳过不支持下载的版本: {version}")
+                results[version] = False
+                continue
+
+            print(f"📥 预取CUDA {version} 安装包...")
+            results[version] = downloader.download_cuda(
+                version, ubuntu_version, cache.staging_dir) is not None
+            if results[version]:
+                manager.enforce(protect=[version])
+        return results
+
+    def start_background(self, versions: Optional[List[str]] = None) -> Optional[int]:
+        """在后台进程中运行预取，已有预取进程在运行时返回None"""
+        if self.running_pid():
+            return None
+
+        cmd = [sys.executable, '-m', f'{__package__}.cli', 'prefetch',
+               '--mirror', self.mirror,
+               '--connections', str(self.connections),
+               '--limit-rate', str(self.rate_limit or 0)]
+        cmd += versions or []
+
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.log_file, 'a') as log:
+            process = subprocess.Popen(
+                cmd,
+                cwd=Path(__file__).resolve().parent.parent,
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True  # 脱离当前终端，命令返回后继续运行
+            )
+        return process.pid
+
+    def running_pid(self) -> Optional[int]:
+        """返回正在运行的预取进程PID
+
+        以PID文件上的锁判断，不依赖PID本身：进程退出后PID可能已被其他进程复用。
+        """
+        try:
+            with open(self.pid_file) as pid_lock:
+                try:
+                    fcntl.flock(pid_lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except OSError:
+                    return int(pid_lock.read() or 0) or None
+                # 没有进程持有锁：残留的PID文件
+                return None
+        except (OSError, ValueError):
+            return None
+
+    def _lower_priority(self):
+        """降低CPU和磁盘I/O优先级，避免影响前台任务"""
+        try:
+            os.nice(19)
+        except OSError:
+            pass
+
+        try:
+            import psutil
+            psutil.Process().ionice(psutil.IOPRIO_CLASS_IDLE)
+        except Exception:
+            pass
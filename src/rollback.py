@@ -5,6 +5,7 @@ from pathlib import Path
 from datetime import datetime
 from .version_manager import CudaVersionManager
 from .version_detector import CudaVersionDetector
+from .transaction_store import TransactionStore
 
 class RollbackManager:
     def __init__(self):
@@ -17,6 +18,7 @@ class RollbackManager:
             'name': name,
             'timestamp': datetime.now().isoformat(),
             'cuda_version': self._get_current_cuda(),
+            'transaction_id': self._get_latest_transaction(),
             'environment_vars': dict(os.environ),
             'installed_packages': self._get_pip_packages()
         }
@@ -45,6 +47,16 @@ class RollbackManager:
         detector = CudaVersionDetector()
         return detector.get_current_cuda_version()
     
+    def _get_latest_transaction(self):
+        """最近一次已提交的事务，其快照会一直保留直到检查点被删除"""
+        db_path = Path.home() / '.deeplearningmate' / 'transactions' / 'transactions.db'
+        if not db_path.exists():
+            return None
+        store = TransactionStore(db_path)
+        latest = store.latest('committed')
+        store.close()
+        return latest['id'] if latest else None
+    
     def _get_pip_packages(self):
         """获取已安装的pip包列表"""
         try:
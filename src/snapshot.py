@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import errno
+import fcntl
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from .tree_copy import TreeCopier
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# 文件系统不支持reflink时ioctl可能返回的错误
+REFLINK_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL,
+                       errno.ENOSYS, errno.EPERM}
+
+# 清单中每个条目的字段顺序：类型(f/d/l)、大小、修改时间、inode、权限、软链接指向、可选哈希
+MANIFEST_FIELDS = ('type', 'size', 'mtime_ns', 'ino', 'mode', 'target', 'sha256')
+
+class SnapshotEngine:
+    """低成本目录快照：优先reflink，文件系统不支持时并行完整复制
+
+    不使用硬链接：硬链接与现有文件共享inode，之后任何原地写入（复制cuDNN、
+    pip、手动修改、chmod）都会同时改写快照，回滚时无法恢复原内容。
+    """
+
+    def __init__(self, hash_files: bool = False):
+        # 开启后清单记录文件内容哈希，比较更严格但需要读取全部数据
+        self.hash_files = hash_files
+        # reflink不可用时，剩余文件交给并行复制引擎
+        self.copier = TreeCopier()
+
+    def snapshot(self, source: Path, target: Path, parent: Optional[Path] = None) -> Dict:
+        """为source创建快照到target，返回使用的策略及文件数、字节数
+
+        每个快照附带一份清单（target同级的.manifest.json）。指定parent时，
+        只保存与父快照清单相比发生变化的文件，其余文件通过父快照链获取。
+        """
+        started = time.monotonic()
+        stats = {'strategy': 'reflink', 'files': 0, 'bytes': 0,
+                 'stored_files': 0, 'stored_bytes': 0, 'copied_bytes': 0}
+
+        if source.is_symlink():
+            # 软链接只记录指向，不复制目标内容
+            os.symlink(os.readlink(source), target)
+            stats['strategy'] = 'symlink'
+        else:
+            entries = self.build_manifest(source)
+            parent_entries = {}
+            if parent is not None:
+                try:
+                    parent_entries = self.load_manifest(parent)['entries']
+                except (OSError, ValueError):
+                    print(f"⚠️ 父快照清单不可用，创建完整快照: {parent}")
+                    parent = None
+
+            os.mkdir(target)
+            stored = []
+            jobs = []
+            for rel, entry in entries.items():
+                if entry[0] != 'f':
+                    continue
+                stats['files'] += 1
+                stats['bytes'] += entry[1]
+                if parent_entries.get(rel) == entry:
+                    continue
+
+                dst = os.path.join(target, rel)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                jobs.append((os.path.join(source, rel), dst, entry[1]))
+                stored.append(rel)
+                stats['stored_files'] += 1
+                stats['stored_bytes'] += entry[1]
+            self._clone_files(jobs, stats, source.name)
+
+            self._save_manifest(target, {
+                'source': str(source),
+                'parent': str(parent) if parent else None,
+                'fields': MANIFEST_FIELDS,
+                'entries': entries,
+                'stored': stored
+            })
+
+        stats['seconds'] = round(time.monotonic() - started, 3)
+        return stats
+
+    def restore(self, snapshot: Path, target: Path) -> Dict:
+        """按快照清单链把目录树重建到target"""
+        started = time.monotonic()
+        stats = {'strategy': 'reflink', 'files': 0, 'bytes': 0, 'copied_bytes': 0}
+
+        if snapshot.is_symlink():
+            os.symlink(os.readlink(snapshot), target)
+            stats['strategy'] = 'symlink'
+        elif not self.manifest_path(snapshot).exists():
+            # 没有清单的旧快照：直接克隆整棵树
+            self._clone_tree(str(snapshot), str(target), stats)
+        else:
+            chain = self._load_chain(snapshot)
+            entries = chain[0][1]
+            os.mkdir(target)
+            directories = [(str(target), entries['.'][4], entries['.'][2])]
+            jobs = []
+
+            for rel in sorted(entries):
+                if rel == '.':
+                    continue
+                kind, size, mtime_ns, _, mode, link_target = entries[rel][:6]
+                path = os.path.join(target, rel)
+                if kind == 'd':
+                    os.mkdir(path)
+                    directories.append((path, mode, mtime_ns))
+                elif kind == 'l':
+                    os.symlink(link_target, path)
+                else:
+                    jobs.append((self._locate(rel, chain), path, size))
+                    stats['files'] += 1
+                    stats['bytes'] += size
+            self._clone_files(jobs, stats, target.name)
+
+            # 最后再设置目录的权限和时间，避免被后续写入覆盖
+            for path, mode, mtime_ns in reversed(directories):
+                os.chmod(path, mode & 0o7777)
+                os.utime(path, ns=(mtime_ns, mtime_ns))
+
+        stats['seconds'] = round(time.monotonic() - started, 3)
+        return stats
+
+    def build_manifest(self, source: Path) -> Dict[str, List]:
+        """遍历目录树生成清单：相对路径 -> 条目"""
+        entries = {}
+        self._scan(str(source), '', entries)
+        return entries
+
+    def manifest_path(self, snapshot: Path) -> Path:
+        return snapshot.with_name(snapshot.name + '.manifest.json')
+
+    def load_manifest(self, snapshot: Path) -> Dict:
+        with open(self.manifest_path(snapshot)) as f:
+            return json.load(f)
+
+    def _save_manifest(self, snapshot: Path, manifest: Dict):
+        with open(self.manifest_path(snapshot), 'w') as f:
+            json.dump(manifest, f, separators=(',', ':'))
+
+    def _scan(self, root: str, rel: str, entries: Dict[str, List]):
+        """递归记录目录、文件和软链接的元数据"""
+        path = os.path.join(root, rel) if rel else root
+        stat = os.lstat(path)
+        entries[rel or '.'] = ['d', 0, stat.st_mtime_ns, stat.st_ino, stat.st_mode, None, None]
+
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                child = os.path.join(rel, entry.name) if rel else entry.name
+                if entry.is_symlink():
+                    stat = entry.stat(follow_symlinks=False)
+                    entries[child] = ['l', 0, stat.st_mtime_ns, stat.st_ino, stat.st_mode,
+                                      os.readlink(entry.path), None]
+                elif entry.is_dir(follow_symlinks=False):
+                    self._scan(root, child, entries)
+                else:
+                    stat = entry.stat(follow_symlinks=False)
+                    digest = self._hash_file(entry.path) if self.hash_files else None
+                    entries[child] = ['f', stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                                      stat.st_mode, None, digest]
+
+    def flatten(self, snapshot: Path) -> int:
+        """把父快照链中的文件克隆进snapshot并断开parent指针，返回补入的文件数
+
+        之后父快照即可删除而不影响该快照的恢复。文件通过reflink或复制补入，
+        清单在全部文件就位后才原子替换，中途中断时快照仍按原链可用。
+        """
+        manifest = self.load_manifest(snapshot)
+        if not manifest.get('parent'):
+            return 0
+
+        chain = self._load_chain(snapshot)
+        stored = set(manifest['stored'])
+        stats = {'strategy': 'reflink', 'copied_bytes': 0}
+        jobs = []
+        for rel, entry in manifest['entries'].items():
+            if entry[0] != 'f' or rel in stored:
+                continue
+            dst = os.path.join(snapshot, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if os.path.lexists(dst):
+                # 上次中断的合并留下的文件
+                os.unlink(dst)
+            jobs.append((self._locate(rel, chain), dst, entry[1]))
+        self._clone_files(jobs, stats, snapshot.name)
+
+        manifest['parent'] = None
+        manifest['stored'] = sorted(stored.union(os.path.relpath(dst, snapshot)
+                                                 for _, dst, _ in jobs))
+        tmp_path = self.manifest_path(snapshot).with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, separators=(',', ':'))
+        os.replace(tmp_path, self.manifest_path(snapshot))
+        return len(jobs)
+
+    def _load_chain(self, snapshot: Path) -> List[Tuple[Path, Dict, set]]:
+        """沿parent指针加载快照链：[(快照目录, 清单条目, 本快照保存的文件)]"""
+        chain = []
+        current = snapshot
+        while current is not None:
+            manifest = self.load_manifest(current)
+            chain.append((current, manifest['entries'], set(manifest['stored'])))
+            current = Path(manifest['parent']) if manifest.get('parent') else None
+        return chain
+
+    def _locate(self, rel: str, chain: List[Tuple[Path, Dict, set]]) -> str:
+        """找到链上实际保存了该文件数据的快照"""
+        for snapshot, _, stored in chain:
+            if rel in stored:
+                return os.path.join(snapshot, rel)
+        raise FileNotFoundError(f"快照链中缺少文件数据: {rel}")
+
+    def _hash_file(self, path: str) -> str:
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(8 * 1024 * 1024), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def break_links(self, path: Path) -> int:
+        """打断path下与快照共享inode的文件（写时复制），返回处理的文件数
+
+        旧版本创建的硬链接快照与现有文件共享数据，原地修改会同时改坏快照。
+        在修改前把这些文件复制为独立的新inode，快照中的旧inode保持不变。
+        """
+        if not path.exists() or path.is_symlink():
+            return 0
+
+        broken = 0
+        for dirpath, _, filenames in os.walk(path):
+            for name in filenames:
+                file_path = os.path.join(dirpath, name)
+                stat = os.lstat(file_path)
+                if stat.st_nlink > 1 and not os.path.islink(file_path):
+                    tmp_path = os.path.join(dirpath, f'.{name}.dlmate-cow')
+                    shutil.copy2(file_path, tmp_path)
+                    os.replace(tmp_path, file_path)
+                    broken += 1
+        return broken
+
+    def _clone_tree(self, source: str, target: str, stats: Dict):
+        """递归克隆目录，保留软链接"""
+        os.mkdir(target)
+        with os.scandir(source) as entries:
+            for entry in entries:
+                dst = os.path.join(target, entry.name)
+                if entry.is_symlink():
+                    os.symlink(os.readlink(entry.path), dst)
+                elif entry.is_dir(follow_symlinks=False):
+                    self._clone_tree(entry.path, dst, stats)
+                else:
+                    size = entry.stat(follow_symlinks=False).st_size
+                    self._clone_file(entry.path, dst, stats, size)
+                    stats['files'] += 1
+                    stats['bytes'] += size
+        shutil.copystat(source, target, follow_symlinks=False)
+
+    def _clone_files(self, jobs: List[Tuple[str, str, int]], stats: Dict, desc: str):
+        """逐个reflink；一旦降级为复制，剩余文件并行复制"""
+        for index, (source, target, size) in enumerate(jobs):
+            if stats['strategy'] == 'copy':
+                stats['copied_bytes'] += self.copier.copy_files(jobs[index:], desc)
+                return
+            self._clone_file(source, target, stats, size)
+
+    def _clone_file(self, source: str, target: str, stats: Dict, size: int):
+        """按当前策略克隆单个文件，不支持时逐级降级"""
+        if stats['strategy'] == 'reflink':
+            try:
+                self._reflink(source, target)
+                return
+            except OSError as e:
+                if e.errno not in REFLINK_UNSUPPORTED:
+                    raise
+                stats['strategy'] = 'copy'
+
+        self.copier.copy_file(source, target)
+        stats['copied_bytes'] += size
+
+    def _reflink(self, source: str, target: str):
+        """通过FICLONE让两个文件共享数据块（btrfs/xfs等支持写时复制的文件系统）"""
+        with open(source, 'rb') as src, open(target, 'xb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError:
+                os.unlink(target)
+                raise
+        shutil.copystat(source, target, follow_symlinks=False)
@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import fcntl
+import shutil
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+from .config import load_config, parse_size
+from .snapshot import SnapshotEngine
+from .transaction_store import TransactionStore
+from .atomic_fs import move_to_trash, delete_in_background
+
+# 回滚失败或中止的事务，快照是手动恢复系统的唯一依据，只在显式要求时删除
+FAILED_STATUSES = ('rollback_failed', 'aborted')
+
+class SnapshotRetention:
+    """事务快照的保留策略
+
+    保留最近keep_last个已提交事务的快照、检查点引用的快照以及作为
+    后续增量快照父快照的各目录树最新快照，总大小超出size_limit时从最旧的
+    已提交快照开始放弃保留。回滚失败和中止的事务快照始终保留，直到显式清理；
+    进行中的事务的快照所依赖的父快照链在事务结束前也不会删除。其余快照在后台低优先级进程中删除：
+    仍被保留快照作为父快照引用的，先把数据合并进子快照再删除。
+    """
+
+    def __init__(self, backup_dir: Optional[Path] = None,
+                 store: Optional[TransactionStore] = None):
+        self.backup_dir = backup_dir or Path.home() / '.deeplearningmate' / 'transactions'
+        self.store = store or TransactionStore(self.backup_dir / 'transactions.db')
+        self.checkpoint_dir = Path.home() / '.deeplearningmate' / 'backups'
+        self.manifest_heads_file = self.backup_dir / 'manifest_heads.json'
+        self.lock_file = self.backup_dir / 'retention.lock'
+        self.log_file = self.backup_dir / 'retention.log'
+        self.trash_dir = self.backup_dir / '.dlmate-trash'
+
+        settings = load_config().get('snapshot_retention') or {}
+        self.keep_last = settings.get('keep_last', 5)
+        self.size_limit = parse_size(settings.get('size_limit'))
+
+    def plan(self, include_failed: bool = False) -> Dict[str, List[Dict]]:
+        """根据事务索引决定保留和删除的快照：{'keep': [...], 'prune': [...]}
+
+        include_failed=True时回滚失败和中止的事务快照也按普通快照处理。
+        """
+        finished = self.store.finished_snapshots()
+        protected = self._checkpoint_transactions() | self._head_transactions() | \
+            self._active_ancestors()
+        if not include_failed:
+            protected |= {row['id'] for row in finished if row['status'] in FAILED_STATUSES}
+
+        committed = [row for row in finished if row['status'] == 'committed']
+        keep = {row['id'] for row in committed[:self.keep_last]} | protected
+
+        # 总大小超限时从最旧的已提交快照开始放弃，受保护的快照除外
+        if self.size_limit:
+            kept_rows = [row for row in committed if row['id'] in keep]
+            total = sum(row['stored_bytes'] for row in kept_rows)
+            for row in reversed(kept_rows):
+                if total <= self.size_limit:
+                    break
+                if row['id'] not in protected:
+                    keep.discard(row['id'])
+                    total -= row['stored_bytes']
+
+        return {
+            'keep': [row for row in finished if row['id'] in keep],
+            'prune': [row for row in finished if row['id'] not in keep]
+        }
+
+    def schedule(self) -> Optional[int]:
+        """有需要删除的快照时启动后台清理进程，返回进程pid"""
+        if not self.plan()['prune'] and not self._trash_pending():
+            return None
+
+        cmd = ['nice', '-n', '19']
+        if shutil.which('ionice'):
+            cmd += ['ionice', '-c', '3']
+        cmd += [sys.executable, '-m', f'{__package__}.cli', 'prune-snapshots']
+
+        try:
+            with open(self.log_file, 'a') as log:
+                process = subprocess.Popen(
+                    cmd,
+                    cwd=Path(__file__).resolve().parent.parent,
+                    stdin=subprocess.DEVNULL,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    start_new_session=True  # 前台命令返回后继续运行
+                )
+        except OSError:
+            return None
+        return process.pid
+
+    def prune(self, dry_run: bool = False, include_failed: bool = False) -> List[Dict]:
+        """删除不再保留的快照，返回被删除的事务；已有清理在运行时直接返回"""
+        with open(self.lock_file, 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return []
+
+            plan = self.plan(include_failed)
+            if dry_run:
+                return plan['prune']
+
+            victims = {row['id'] for row in plan['prune']}
+            engine = SnapshotEngine()
+
+            # 1. 父快照即将被删除的保留快照，先把父快照链的数据合并进来
+            for row in plan['keep']:
+                for tree in self._snapshot_trees(row):
+                    manifest = engine.load_manifest(tree)
+                    if manifest.get('parent') and \
+                            self._owner(Path(manifest['parent'])) in victims:
+                        merged = engine.flatten(tree)
+                        print(f"🔗 合并父快照数据: {tree}（{merged} 个文件）")
+
+            # 2. 快照目录移入回收目录，事务记录保留在历史中
+            trash = self.trash_dir / f'{os.getpid()}_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+            for row in plan['prune']:
+                move_to_trash(Path(row['snapshot_dir']), trash)
+                self.store.mark_pruned(row['id'])
+                print(f"🧹 删除快照: {row['id']}（{row['stored_bytes'] / (1024 ** 2):.1f} MB）")
+
+            # 3. 包括之前中断的清理留下的回收目录一并删除
+            if self._trash_pending():
+                delete_in_background(list(self.trash_dir.iterdir()))
+            return plan['prune']
+
+    def _trash_pending(self) -> bool:
+        """回收目录中是否还有之前未删除完的快照"""
+        try:
+            return any(self.trash_dir.iterdir())
+        except OSError:
+            return False
+
+    def _snapshot_trees(self, row: Dict) -> List[Path]:
+        """事务快照中带清单的目录树"""
+        snapshot_dir = Path(row['snapshot_dir'])
+        manifests = list(snapshot_dir.glob('*.manifest.json')) + \
+            list(snapshot_dir.glob('paths/*.manifest.json'))
+        return [manifest.with_name(manifest.name[:-len('.manifest.json')])
+                for manifest in manifests]
+
+    def _owner(self, snapshot: Path) -> Optional[str]:
+        """快照目录树所属的事务ID"""
+        try:
+            return snapshot.relative_to(self.backup_dir).parts[0]
+        except (ValueError, IndexError):
+            return None
+
+    def _active_ancestors(self) -> Set[str]:
+        """进行中的事务的增量快照所依赖的父快照链，回滚时需要沿链读取数据"""
+        engine = SnapshotEngine()
+        ancestors = set()
+        for row in self.store.active():
+            if not row['snapshot_dir']:
+                continue
+            for tree in self._snapshot_trees(row):
+                current = tree
+                while current is not None:
+                    try:
+                        parent = engine.load_manifest(current).get('parent')
+                    except (OSError, ValueError):
+                        break
+                    current = Path(parent) if parent else None
+                    if current is not None:
+                        ancestors.add(self._owner(current))
+        return ancestors - {None}
+
+    def _head_transactions(self) -> Set[str]:
+        """各目录树最新快照所属的事务，后续增量快照以它们为父快照"""
+        try:
+            with open(self.manifest_heads_file) as f:
+                heads = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        return {self._owner(Path(head)) for head in heads.values()} - {None}
+
+    def _checkpoint_transactions(self) -> Set[str]:
+        """检查点引用的事务"""
+        referenced = set()
+        for checkpoint_file in self.checkpoint_dir.glob('*.json'):
+            try:
+                with open(checkpoint_file) as f:
+                    transaction_id = json.load(f).get('transaction_id')
+            except (OSError, ValueError):
+                continue
+            if transaction_id:
+                referenced.add(transaction_id)
+        return referenced
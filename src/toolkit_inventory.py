@@ -0,0 +1,236 @@
+import os
+import re
+import sys
+import json
+import glob
+import site
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional
+from .version_detector import CudaVersionDetector
+
+# conda中提供CUDA运行时/工具包的包名，按优先级排列
+CONDA_TOOLKIT_PACKAGES = ('cuda-toolkit', 'cudatoolkit', 'cuda-nvcc', 'cuda-cudart',
+                          'cuda-runtime')
+# pip wheel（dist-info目录名）中提供CUDA运行时的包
+PIP_TOOLKIT_PACKAGES = ('nvidia_cuda_runtime_cu', 'nvidia_cuda_nvcc_cu')
+
+class ToolkitInventory:
+    """并发发现本机所有CUDA工具包，结果持久化并按目录修改时间失效
+
+    覆盖系统安装目录（/usr/local、/opt下任意名称）、conda环境中的
+    cudatoolkit/cuda-*包以及pip安装的nvidia-*-cu1x wheel。
+    """
+
+    def __init__(self):
+        self.inventory_file = Path.home() / '.deeplearningmate' / 'toolkit_inventory.json'
+        self.system_roots = ['/usr/local', '/opt']
+        self.conda_roots = [os.environ.get('CONDA_PREFIX'), os.environ.get('CONDA_ROOT'),
+                            '~/miniconda3', '~/anaconda3', '~/miniforge3', '~/mambaforge',
+                            '/opt/conda']
+        self.detector = CudaVersionDetector()
+        self.workers = min(16, (os.cpu_count() or 4) * 2)
+
+    def toolkits(self, refresh: bool = False) -> List[Dict]:
+        """返回所有工具包；未变化的位置直接使用持久化的结果"""
+        cached = {} if refresh else self._load().get('locations', {})
+
+        locations = self._candidate_locations()
+        results = {}
+        pending = []
+        for location, kind in locations.items():
+            stamp = self._stamp(location, kind)
+            if stamp is None:
+                continue
+            entry = cached.get(location)
+            if entry and entry['stamp'] == stamp:
+                results[location] = entry
+            else:
+                pending.append((location, kind, stamp))
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for location, entry in zip([item[0] for item in pending],
+                                           pool.map(self._inspect, pending)):
+                    results[location] = entry
+
+        if pending or set(results) != set(cached):
+            self._save({'updated': datetime.now().isoformat(), 'locations': results})
+
+        toolkits = [toolkit for entry in results.values() for toolkit in entry['toolkits']]
+        return sorted(toolkits, key=lambda toolkit: (toolkit['source'], toolkit['path']))
+
+    def _candidate_locations(self) -> Dict[str, str]:
+        """列出可能包含工具包的位置：路径 -> 类型（system/conda/pip）"""
+        locations = {}
+
+        # 系统目录：不依赖目录名，与版本管理使用同一判定（包含nvcc，排除临时和备份目录）
+        for root in self.system_roots:
+            try:
+                entries = list(os.scandir(root))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False) and \
+                        self.detector.is_toolkit_dir(entry.path):
+                    locations[entry.path] = 'system'
+
+        # conda环境：根环境以及envs/下的各环境
+        prefixes = set()
+        for root in self.conda_roots:
+            if not root:
+                continue
+            root = os.path.expanduser(root)
+            if os.path.isdir(os.path.join(root, 'conda-meta')):
+                prefixes.add(os.path.realpath(root))
+            for env in glob.glob(os.path.join(root, 'envs', '*', 'conda-meta')):
+                prefixes.add(os.path.realpath(os.path.dirname(env)))
+        for prefix in prefixes:
+            locations[prefix] = 'conda'
+            for site_packages in glob.glob(os.path.join(prefix, 'lib', 'python3*', 'site-packages')):
+                locations[site_packages] = 'pip'
+
+        # 当前解释器的site-packages
+        for site_packages in site.getsitepackages() + [site.getusersitepackages()] + sys.path:
+            if site_packages.endswith('site-packages') and os.path.isdir(site_packages):
+                locations.setdefault(os.path.realpath(site_packages), 'pip')
+
+        return locations
+
+    def _stamp(self, location: str, kind: str) -> Optional[List[int]]:
+        """位置的失效标记：安装、卸载或升级都会改变这些目录的修改时间"""
+        if kind == 'system':
+            # lib64通常是指向targets/下的软链接，stat跟随软链接取实际库目录的时间
+            paths = [location] + [os.path.join(location, name) for name in
+                                  ('bin', 'include', 'lib64', 'lib', 'version.json')]
+        elif kind == 'conda':
+            paths = [os.path.join(location, 'conda-meta')]
+        else:
+            paths = [location, os.path.join(location, 'nvidia')]
+
+        stamp = []
+        for path in paths:
+            try:
+                stamp.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamp.append(0)
+        return stamp if stamp[0] else None
+
+    def _inspect(self, item) -> Dict:
+        location, kind, stamp = item
+        if kind == 'system':
+            toolkits = [self._inspect_system(location)]
+        elif kind == 'conda':
+            toolkits = self._inspect_conda(location)
+        else:
+            toolkits = self._inspect_pip(location)
+        return {'kind': kind, 'stamp': stamp, 'toolkits': [toolkit for toolkit in toolkits if toolkit]}
+
+    def _inspect_system(self, path: str) -> Optional[Dict]:
+        version = self.detector.read_toolkit_version(path)
+        if version is None:
+            # 没有版本文件的旧版本只能从目录名推断
+            match = re.search(r'(\d+\.\d+)', os.path.basename(path))
+            version = match.group(1) if match else None
+
+        return {
+            'source': 'system',
+            'path': path,
+            'version': version,
+            'cudnn': self._cudnn_from_headers(path),
+            'nvcc': os.path.exists(os.path.join(path, 'bin', 'nvcc')),
+            'size': self._tree_size(path)
+        }
+
+    def _inspect_conda(self, prefix: str) -> List[Dict]:
+        packages = {}
+        size = 0
+        for meta in glob.glob(os.path.join(prefix, 'conda-meta', '*.json')):
+            # 文件名格式：<name>-<version>-<build>.json
+            parts = os.path.basename(meta)[:-len('.json')].rsplit('-', 2)
+            if len(parts) != 3:
+                continue
+            name, version, _ = parts
+            packages[name] = version
+            if name in CONDA_TOOLKIT_PACKAGES or name.startswith(('cuda-', 'libcu', 'cudnn')):
+                try:
+                    with open(meta) as f:
+                        size += json.load(f).get('size') or 0
+                except (OSError, ValueError):
+                    pass
+
+        version = next((packages[name] for name in CONDA_TOOLKIT_PACKAGES if name in packages), None)
+        if version is None:
+            return []
+        return [{
+            'source': 'conda',
+            'path': prefix,
+            'version': version,
+            'cudnn': packages.get('cudnn'),
+            'nvcc': os.path.exists(os.path.join(prefix, 'bin', 'nvcc')),
+            'size': size
+        }]
+
+    def _inspect_pip(self, site_packages: str) -> List[Dict]:
+        packages = {}
+        for dist_info in glob.glob(os.path.join(site_packages, 'nvidia_*.dist-info')):
+            # 目录名格式：<name>-<version>.dist-info
+            name, _, version = os.path.basename(dist_info)[:-len('.dist-info')].partition('-')
+            packages[name] = version
+
+        runtime = [name for name in packages if name.startswith(PIP_TOOLKIT_PACKAGES)]
+        if not runtime:
+            return []
+
+        nvidia_dir = os.path.join(site_packages, 'nvidia')
+        cudnn = next((version for name, version in packages.items()
+                      if name.startswith('nvidia_cudnn_cu')), None)
+        return [{
+            'source': 'pip',
+            'path': nvidia_dir,
+            'version': packages[sorted(runtime)[0]],
+            'cudnn': cudnn,
+            'nvcc': os.path.exists(os.path.join(nvidia_dir, 'cuda_nvcc', 'bin', 'nvcc')),
+            'size': self._tree_size(nvidia_dir)
+        }]
+
+    def _cudnn_from_headers(self, path: str) -> Optional[str]:
+        """从cudnn_version.h（cuDNN 8+）或cudnn.h读取cuDNN版本"""
+        for header in ('cudnn_version.h', 'cudnn.h'):
+            try:
+                with open(os.path.join(path, 'include', header)) as f:
+                    content = f.read()
+            except OSError:
+                continue
+            parts = [re.search(rf'#define CUDNN_{field}\s+(\d+)', content)
+                     for field in ('MAJOR', 'MINOR', 'PATCHLEVEL')]
+            if all(parts):
+                return '.'.join(part.group(1) for part in parts)
+        return None
+
+    def _tree_size(self, path: str) -> int:
+        total = 0
+        for dirpath, _, filenames in os.walk(path):
+            for name in filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.inventory_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, inventory: Dict):
+        # 只读命令不创建数据目录，目录不存在时只跳过持久化
+        if not self.inventory_file.parent.is_dir():
+            return
+        tmp_file = self.inventory_file.with_name(self.inventory_file.name + '.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(inventory, f, indent=2)
+        os.replace(tmp_file, self.inventory_file)
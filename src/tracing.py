@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+class Span:
+    """一个阶段的计时记录；bytes、files等计数可在阶段内随时累加"""
+
+    def __init__(self, name: str, category: str, args: Dict):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = time.perf_counter()
+        self.duration = 0.0
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def add(self, **counts):
+        """累加计数，如 span.add(bytes=n, files=1)"""
+        for key, value in counts.items():
+            self.args[key] = self.args.get(key, 0) + value
+
+class Tracer:
+    """把各阶段的耗时、字节数和文件数写入Chrome trace JSON或JSON lines
+
+    输出文件以.jsonl结尾时每个阶段结束即追加一行，否则在进程退出时写出
+    可由chrome://tracing、Perfetto等工具直接打开的traceEvents文件。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.json_lines = self.path.suffix == '.jsonl'
+        self.events: List[Dict] = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.json_lines:
+            self.path.write_text('')
+        atexit.register(self.flush)
+
+    def record(self, span: Span):
+        event = {
+            'name': span.name,
+            'cat': span.category,
+            'ph': 'X',
+            'ts': round((span.start - self.origin) * 1e6, 1),
+            'dur': round(span.duration * 1e6, 1),
+            'pid': self.pid,
+            'tid': threading.get_native_id(),
+            'args': span.args
+        }
+        with self.lock:
+            if self.json_lines:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(event, ensure_ascii=False, default=str) + '\n')
+            else:
+                self.events.append(event)
+
+    def flush(self):
+        """写出Chrome trace文件（JSON lines模式下已实时写入）"""
+        if self.json_lines:
+            return
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event['ts'])
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f,
+                      ensure_ascii=False, default=str)
+        os.replace(tmp_path, self.path)
+
+_tracer: Optional[Tracer] = None
+
+def enable_tracing(path: Path) -> Tracer:
+    """开启进程内的阶段追踪，结果写入path"""
+    global _tracer
+    _tracer = Tracer(path)
+    return _tracer
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+@contextmanager
+def span(name: str, category: str = 'dlmate', **args):
+    """记录一个阶段：with span('download', version='12.1') as s: s.add(bytes=n)
+
+    未开启追踪时只创建一个轻量的Span对象，不做任何记录。
+    """
+    current = Span(name, category, args)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        if _tracer is not None:
+            _tracer.record(current)
+
+def traced(name: str, category: str = 'dlmate'):
+    """把整个函数记录为一个阶段的装饰器，返回值为False时标记失败"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, category) as current:
+                result = func(*args, **kwargs)
+                if result is False:
+                    current.set(ok=False)
+                return result
+        return wrapper
+    return decorator
@@ -1,5 +1,7 @@
 import os
+import glob
 import json
+import fcntl
 import shutil
 import signal
 import atexit
@@ -8,6 +10,12 @@ from pathlib import Path
 from datetime import datetime
 from contextlib import contextmanager
 from typing import Dict, List, Optional, Callable
+from .journal import TransactionJournal
+from .snapshot import SnapshotEngine
+from .transaction_store import TransactionStore
+from .snapshot_retention import SnapshotRetention
+from .tracing import span, traced
+from .atomic_fs import swap_into_place, replace_symlink, move_to_trash, delete_in_background
 
 class TransactionManager:
     def __init__(self):
@@ -15,20 +23,44 @@ class TransactionManager:
         self.backup_dir.mkdir(parents=True, exist_ok=True)
         self.current_transaction = None
         self.rollback_stack = []
+        self.snapshot_engine = SnapshotEngine()
+        # 每棵目录树最近一次已提交快照的位置，作为增量快照的父快照
+        self.manifest_heads_file = self.backup_dir / 'manifest_heads.json'
+        self.journals: Dict[str, TransactionJournal] = {}
+        
+        # 事务元数据的SQLite索引；首次使用时从已有的事务日志导入
+        self.store = TransactionStore(self.backup_dir / 'transactions.db')
+        if not self.store.exists():
+            self.store.rebuild(self.list_transactions())
+        self.retention = SnapshotRetention(self.backup_dir, self.store)
         
         # 注册信号处理器，处理意外中断
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
         atexit.register(self._cleanup_on_exit)
+        
+        # 处理之前崩溃的进程遗留的未完成事务
+        self.recover_incomplete_transactions()
     
     @contextmanager
-    def transaction(self, operation_name: str):
-        """事务上下文管理器"""
-        transaction_id = self._create_transaction(operation_name)
+    def transaction(self, operation_name: str, paths: Optional[List] = None):
+        """事务上下文管理器
+
+        paths声明本次操作会修改的路径（软链接、安装目录、shell配置文件等），
+        此时只为这些路径创建快照；不声明时为所有CUDA目录和配置文件创建完整快照。
+        """
+        transaction_id = self._create_transaction(operation_name, paths)
         
         try:
             print(f"🔒 开始事务: {operation_name} (ID: {transaction_id})")
-            yield TransactionContext(self, transaction_id)
+            context = TransactionContext(self, transaction_id)
+            yield context
+            
+            if context.aborted:
+                # 操作以返回值报告失败：回滚而不是提交
+                print(f"❌ 事务失败: {operation_name}")
+                self._rollback_transaction(transaction_id)
+                return
             
             # 事务成功完成
             self._commit_transaction(transaction_id)
@@ -45,30 +77,107 @@ class TransactionManager:
         finally:
             self._cleanup_transaction(transaction_id)
     
-    def _create_transaction(self, operation_name: str) -> str:
+    def _create_transaction(self, operation_name: str, paths: Optional[List] = None) -> str:
         """创建新事务"""
-        transaction_id = f"{operation_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        # 精确到微秒，同一秒内的多次操作不会共用同一个事务ID
+        transaction_id = f"{operation_name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
         
         transaction_data = {
+            'type': 'begin',
             'id': transaction_id,
             'operation': operation_name,
             'start_time': datetime.now().isoformat(),
-            'status': 'active',
-            'rollback_actions': [],
+            'pid': os.getpid(),
             'backups': {}
         }
         
-        # 创建完整的系统快照
-        self._create_system_snapshot(transaction_id, transaction_data)
+        # 先登记到索引，即使在快照过程中崩溃也能被恢复流程发现
+        self.store.record_begin(transaction_data)
         
-        # 保存事务信息
-        transaction_file = self.backup_dir / f'{transaction_id}.json'
-        with open(transaction_file, 'w') as f:
-            json.dump(transaction_data, f, indent=2)
+        # 选定父快照到快照登记进索引之间持有清理锁（共享），后台清理不会删除正被引用的父快照
+        with open(self.retention.lock_file, 'w') as retention_lock:
+            fcntl.flock(retention_lock, fcntl.LOCK_SH)
+            with span('snapshot', 'transaction', transaction=transaction_id) as current:
+                if paths is None:
+                    # 创建完整的系统快照
+                    self._create_system_snapshot(transaction_id, transaction_data)
+                else:
+                    self._create_scoped_snapshot(transaction_id, transaction_data, paths)
+                
+                for stats in transaction_data['backups'].get('cuda_snapshots', {}).values():
+                    if stats and stats['strategy'] != 'symlink':
+                        current.add(files=stats['files'], bytes=stats['bytes'],
+                                    stored_bytes=stats['stored_bytes'])
+            
+            # 快照完成后写入事务日志的起始记录，并在索引中补充快照大小
+            self._journal_append(transaction_id, transaction_data, sync=True)
+            self.store.record_begin(transaction_data)
         
         self.current_transaction = transaction_id
         return transaction_id
     
+    def _journal_path(self, transaction_id: str) -> Path:
+        return self.backup_dir / f'{transaction_id}.journal'
+    
+    def _journal_append(self, transaction_id: str, record: Dict, sync: bool = False):
+        """向事务日志追加一条记录"""
+        journal = self.journals.get(transaction_id)
+        if journal is None:
+            journal = TransactionJournal(self._journal_path(transaction_id))
+            self.journals[transaction_id] = journal
+        journal.append(record, sync=sync)
+        
+        if record.get('type') == 'status':
+            self.store.update_status(transaction_id, record['status'], record.get('end_time'))
+    
+    def load_transaction(self, transaction_id: str) -> Optional[Dict]:
+        """通过重放日志读取事务状态"""
+        journal_path = self._journal_path(transaction_id)
+        if not journal_path.exists():
+            return None
+        return TransactionJournal.replay(journal_path)
+    
+    def list_transactions(self) -> List[Dict]:
+        """读取所有事务的状态"""
+        transactions = []
+        for journal_path in self.backup_dir.glob('*.journal'):
+            state = TransactionJournal.replay(journal_path)
+            if state:
+                transactions.append(state)
+        return transactions
+    
+    def active_transactions(self) -> List[Dict]:
+        """正在进行中（所属进程仍存活）的事务"""
+        return [row for row in self.store.active() if self._is_process_alive(row['pid'])]
+    
+    def recover_incomplete_transactions(self):
+        """回滚由已退出的进程遗留下来的未完成事务"""
+        for row in self.store.active():
+            if self._is_process_alive(row['pid']):
+                continue
+            
+            if not self._journal_path(row['id']).exists():
+                # 事务日志尚未写入说明还没有做任何修改，直接标记为中止
+                self.store.update_status(row['id'], 'aborted')
+                continue
+            
+            print(f"⚠️ 发现未完成的事务: {row['id']}（所属进程已退出），正在回滚...")
+            self._rollback_transaction(row['id'])
+            self._cleanup_transaction(row['id'])
+    
+    def _is_process_alive(self, pid: Optional[int]) -> bool:
+        if not pid:
+            return False
+        if pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+    
     def _create_system_snapshot(self, transaction_id: str, transaction_data: Dict):
         """创建完整的系统快照"""
         print("📸 创建系统快照...")
@@ -76,28 +185,26 @@ class TransactionManager:
         snapshot_dir = self.backup_dir / transaction_id
         snapshot_dir.mkdir(exist_ok=True)
         
-        # 1. 备份CUDA安装目录
+        # 1. 备份CUDA安装目录（支持reflink时耗时与文件数成正比而非字节数，否则完整复制）
+        cuda_snapshots = {}
         cuda_paths = ['/usr/local/cuda', '/usr/local/cuda-*']
         for cuda_path in cuda_paths:
             if '*' in cuda_path:
-                import glob
                 for path in glob.glob(cuda_path):
                     if Path(path).exists():
-                        self._backup_directory(path, snapshot_dir / Path(path).name)
+                        cuda_snapshots[Path(path).name] = self._backup_directory(
+                            path, snapshot_dir / Path(path).name, self._manifest_parent(path))
             else:
-                if Path(cuda_path).exists():
-                    self._backup_directory(cuda_path, snapshot_dir / 'cuda')
+                if Path(cuda_path).exists() or Path(cuda_path).is_symlink():
+                    cuda_snapshots['cuda'] = self._backup_directory(cuda_path, snapshot_dir / 'cuda')
         
-        # 2. 备份环境变量
-        env_backup = {
-            'PATH': os.environ.get('PATH', ''),
-            'LD_LIBRARY_PATH': os.environ.get('LD_LIBRARY_PATH', ''),
-            'CUDA_HOME': os.environ.get('CUDA_HOME', ''),
-            'CUDA_ROOT': os.environ.get('CUDA_ROOT', '')
-        }
+        for name, stats in cuda_snapshots.items():
+            if stats and stats['strategy'] != 'symlink':
+                print(f"  {name}: {stats['strategy']}, {stats['files']} 个文件, "
+                      f"新增 {stats['stored_files']} 个, {stats['seconds']}s")
         
-        with open(snapshot_dir / 'environment.json', 'w') as f:
-            json.dump(env_backup, f, indent=2)
+        # 2. 备份环境变量
+        self._backup_environment(snapshot_dir)
         
         # 3. 备份关键配置文件
         config_files = [
@@ -117,79 +224,263 @@ class TransactionManager:
         transaction_data['backups'] = {
             'snapshot_dir': str(snapshot_dir),
             'cuda_backed_up': True,
+            'cuda_snapshots': cuda_snapshots,
             'env_backed_up': True,
             'configs_backed_up': True
         }
     
-    def _backup_directory(self, source: str, target: Path):
-        """备份目录"""
+    def _create_scoped_snapshot(self, transaction_id: str, transaction_data: Dict, paths: List):
+        """只为操作声明会修改的路径创建快照"""
+        print(f"📸 创建快照（{len(paths)} 个路径）...")
+        
+        snapshot_dir = self.backup_dir / transaction_id
+        paths_dir = snapshot_dir / 'paths'
+        paths_dir.mkdir(parents=True, exist_ok=True)
+        
+        scope = {}
+        tree_snapshots = {}
+        for index, path in enumerate(Path(p) for p in paths):
+            target = paths_dir / f'{index}_{path.name}'
+            
+            if path.is_symlink() or path.is_dir():
+                stats = self._backup_directory(str(path), target, self._manifest_parent(str(path)))
+                kind = 'symlink' if stats['strategy'] == 'symlink' else 'tree'
+                if kind == 'tree':
+                    tree_snapshots[str(path)] = stats
+                    print(f"  {path}: {stats['strategy']}, {stats['files']} 个文件, "
+                          f"新增 {stats['stored_files']} 个, {stats['seconds']}s")
+            elif path.exists():
+                shutil.copy2(path, target)
+                kind = 'file'
+            else:
+                # 操作前不存在的路径，回滚时删除
+                kind = 'absent'
+            
+            scope[str(path)] = {'kind': kind, 'snapshot': str(target)}
+        
+        self._backup_environment(snapshot_dir)
+        
+        transaction_data['backups'] = {
+            'snapshot_dir': str(snapshot_dir),
+            'scope': scope,
+            'cuda_snapshots': tree_snapshots,
+            'env_backed_up': True
+        }
+    
+    def _backup_environment(self, snapshot_dir: Path):
+        """备份环境变量"""
+        env_backup = {
+            'PATH': os.environ.get('PATH', ''),
+            'LD_LIBRARY_PATH': os.environ.get('LD_LIBRARY_PATH', ''),
+            'CUDA_HOME': os.environ.get('CUDA_HOME', ''),
+            'CUDA_ROOT': os.environ.get('CUDA_ROOT', '')
+        }
+        
+        with open(snapshot_dir / 'environment.json', 'w') as f:
+            json.dump(env_backup, f, indent=2)
+    
+    def _backup_directory(self, source: str, target: Path,
+                          parent: Optional[Path] = None) -> Optional[Dict]:
+        """备份目录（软链接只记录指向；指定parent时只保存变化的文件）"""
         source_path = Path(source)
-        if source_path.exists() and source_path.is_dir():
-            if target.exists():
+        if source_path.is_symlink() or (source_path.exists() and source_path.is_dir()):
+            if target.is_symlink():
+                target.unlink()
+            elif target.exists():
                 shutil.rmtree(target)
-            shutil.copytree(source_path, target, symlinks=True)
+            stats = self.snapshot_engine.snapshot(source_path, target, parent)
+            stats['source'] = str(source_path)
+            stats['path'] = str(target)
+            return stats
+        return None
+    
+    def _manifest_parent(self, source: str) -> Optional[Path]:
+        """返回该目录树最近一次已提交的快照（仍存在时）"""
+        head = self._load_manifest_heads().get(source)
+        if head and self.snapshot_engine.manifest_path(Path(head)).exists():
+            return Path(head)
+        return None
+    
+    def _load_manifest_heads(self) -> Dict[str, str]:
+        if not self.manifest_heads_file.exists():
+            return {}
+        with open(self.manifest_heads_file) as f:
+            return json.load(f)
+    
+    @traced('commit', 'transaction')
+    def _commit_transaction(self, transaction_id: str):
+        """提交事务，并把本次快照设为各目录树后续增量快照的父快照"""
+        self._journal_append(transaction_id, {
+            'type': 'status',
+            'status': 'committed',
+            'end_time': datetime.now().isoformat()
+        }, sync=True)
+        transaction_data = self.load_transaction(transaction_id)
+        
+        heads = self._load_manifest_heads()
+        for stats in transaction_data['backups'].get('cuda_snapshots', {}).values():
+            if stats and stats['strategy'] != 'symlink':
+                heads[stats['source']] = stats['path']
+        with open(self.manifest_heads_file, 'w') as f:
+            json.dump(heads, f, indent=2)
+        
+        self.current_transaction = None
     
+    def break_snapshot_links(self, path: Path):
+        """即将原地修改path下的文件时调用，避免改动通过旧版硬链接快照传染到快照"""
+        broken = self.snapshot_engine.break_links(path)
+        if broken:
+            print(f"✂️ 已为 {broken} 个文件解除与快照的共享")
+    
+    @traced('rollback', 'transaction')
     def _rollback_transaction(self, transaction_id: str):
         """回滚事务"""
         print(f"🔄 开始回滚事务: {transaction_id}")
         
-        transaction_file = self.backup_dir / f'{transaction_id}.json'
-        if not transaction_file.exists():
-            print(f"❌ 事务文件不存在: {transaction_id}")
+        transaction_data = self.load_transaction(transaction_id)
+        if not transaction_data:
+            print(f"❌ 事务日志不存在: {transaction_id}")
             return
         
-        with open(transaction_file) as f:
-            transaction_data = json.load(f)
-        
-        snapshot_dir = Path(transaction_data['backups']['snapshot_dir'])
+        self._journal_append(transaction_id, {'type': 'status', 'status': 'rolling_back'}, sync=True)
+        backups = transaction_data['backups']
+        snapshot_dir = Path(backups['snapshot_dir'])
         
         try:
-            # 1. 恢复CUDA目录
-            self._restore_cuda_directories(snapshot_dir)
+            if 'scope' in backups:
+                # 1. 只恢复操作声明过的路径
+                self._restore_scope(backups['scope'])
+            else:
+                # 1. 恢复CUDA目录
+                self._restore_cuda_directories(snapshot_dir)
+                
+                # 恢复配置文件
+                self._restore_config_files(snapshot_dir)
             
             # 2. 恢复环境变量
             self._restore_environment(snapshot_dir)
             
-            # 3. 恢复配置文件
-            self._restore_config_files(snapshot_dir)
-            
             # 4. 执行自定义回滚操作
             for action in reversed(transaction_data.get('rollback_actions', [])):
                 self._execute_rollback_action(action)
             
+            self._journal_append(transaction_id, {
+                'type': 'status',
+                'status': 'rolled_back',
+                'end_time': datetime.now().isoformat()
+            }, sync=True)
             print(f"✅ 事务回滚完成: {transaction_id}")
             
         except Exception as e:
+            self._journal_append(transaction_id, {'type': 'status', 'status': 'rollback_failed'},
+                                 sync=True)
             print(f"❌ 回滚失败: {e}")
             print("请手动检查系统状态")
+        
+        finally:
+            if self.current_transaction == transaction_id:
+                self.current_transaction = None
+    
+    def _execute_rollback_action(self, action: Dict):
+        """执行一条自定义回滚操作"""
+        action_type = action.get('type')
+        
+        if action_type == 'remove_directory':
+            path = Path(action['path'])
+            if path.exists() and not path.is_symlink():
+                shutil.rmtree(path)
+        elif action_type == 'cleanup_file':
+            Path(action['path']).unlink(missing_ok=True)
+        elif action_type == 'restore_cuda_version':
+            install_base = Path(action.get('install_base', '/usr/local'))
+            cuda_link = install_base / 'cuda'
+            cuda_target = install_base / f"cuda-{action['version']}"
+            if cuda_target.exists() and (cuda_link.is_symlink() or not cuda_link.exists()):
+                replace_symlink(cuda_link, str(cuda_target))
+        else:
+            print(f"⚠️ 未知的回滚操作: {action_type}")
+    
+    def _cleanup_transaction(self, transaction_id: str):
+        """事务结束后关闭日志，并在后台清理超出保留策略的旧快照"""
+        journal = self.journals.pop(transaction_id, None)
+        if journal:
+            journal.close()
+        if self.current_transaction == transaction_id:
+            self.current_transaction = None
+        
+        self.retention.schedule()
     
     def _restore_cuda_directories(self, snapshot_dir: Path):
-        """恢复CUDA目录"""
+        """恢复CUDA目录：逐个原子替换，任何中间状态下都有可用的CUDA"""
         print("🔄 恢复CUDA目录...")
         
-        # 删除当前CUDA安装
-        cuda_paths = ['/usr/local/cuda', '/usr/local/cuda-*']
-        for cuda_path in cuda_paths:
-            if '*' in cuda_path:
-                import glob
-                for path in glob.glob(cuda_path):
-                    if Path(path).exists():
-                        shutil.rmtree(path)
+        install_base = Path('/usr/local')
+        snapshots = {item.name: item for item in snapshot_dir.iterdir()
+                     if item.name.startswith('cuda') and
+                     (item.is_symlink() or item.is_dir())}
+        
+        # 快照之后新出现的CUDA目录需要移除
+        live = [Path(path) for path in glob.glob(str(install_base / 'cuda-*'))]
+        extra = [path for path in live if path.name not in snapshots]
+        if (install_base / 'cuda').is_symlink() or (install_base / 'cuda').exists():
+            if 'cuda' not in snapshots:
+                extra.append(install_base / 'cuda')
+        
+        entries = [(install_base / name, item, 'symlink' if item.is_symlink() else 'tree')
+                   for name, item in snapshots.items()]
+        entries += [(path, None, 'absent') for path in extra]
+        self._swap_in_snapshots(entries)
+    
+    def _restore_scope(self, scope: Dict[str, Dict]):
+        """按事务范围恢复各路径"""
+        print("🔄 恢复快照中的路径...")
+        
+        self._swap_in_snapshots([(Path(path), Path(entry['snapshot']), entry['kind'])
+                                 for path, entry in scope.items()])
+    
+    def _swap_in_snapshots(self, entries: List):
+        """把快照换回原位置
+
+        目录先在目标旁（同一文件系统）重建，再通过rename/RENAME_EXCHANGE切换，
+        软链接通过临时软链接加rename替换；最后才切换软链接并移除多余路径，
+        被替换下来的旧目录移入回收目录，由后台低优先级进程删除。
+        """
+        order = {'tree': 0, 'file': 0, 'symlink': 1, 'absent': 2}
+        trash_name = self._trash_name()
+        trash_dirs = set()
+        
+        for path, snapshot, kind in sorted(entries, key=lambda entry: order[entry[2]]):
+            trash = path.parent / '.dlmate-trash' / trash_name
+            if kind == 'tree':
+                staged = path.with_name(f'.{path.name}.dlmate-restore')
+                move_to_trash(staged, trash)  # 上次中断的回滚留下的暂存目录
+                self.snapshot_engine.restore(snapshot, staged)
+                swap_into_place(staged, path, trash)
+            elif kind == 'symlink':
+                if path.is_dir() and not path.is_symlink():
+                    staged = path.with_name(f'.{path.name}.dlmate-restore')
+                    move_to_trash(staged, trash)
+                    os.symlink(os.readlink(snapshot), staged)
+                    swap_into_place(staged, path, trash)
+                else:
+                    replace_symlink(path, os.readlink(snapshot))
+            elif kind == 'file':
+                staged = path.with_name(f'.{path.name}.dlmate-restore')
+                shutil.copy2(snapshot, staged)
+                os.replace(staged, path)
             else:
-                if Path(cuda_path).exists():
-                    if Path(cuda_path).is_symlink():
-                        Path(cuda_path).unlink()
-                    else:
-                        shutil.rmtree(cuda_path)
-        
-        # 恢复备份的CUDA目录
-        for backup_item in snapshot_dir.iterdir():
-            if backup_item.is_dir() and backup_item.name.startswith('cuda'):
-                target_path = Path('/usr/local') / backup_item.name
-                if backup_item.name == 'cuda':
-                    target_path = Path('/usr/local/cuda')
-                
-                shutil.copytree(backup_item, target_path, symlinks=True)
+                move_to_trash(path, trash)
+            
+            if trash.exists():
+                trash_dirs.add(trash)
+        
+        if trash_dirs:
+            delete_in_background(sorted(trash_dirs))
+            print("🗑️ 旧目录将在后台删除")
+    
+    def _trash_name(self) -> str:
+        """本次回滚使用的回收目录名"""
+        return f'{os.getpid()}_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
     
     def _restore_environment(self, snapshot_dir: Path):
         """恢复环境变量"""
@@ -239,15 +530,16 @@ class TransactionContext:
     def __init__(self, manager: TransactionManager, transaction_id: str):
         self.manager = manager
         self.transaction_id = transaction_id
+        self.aborted = False
+    
+    def abort(self):
+        """标记操作失败，离开with块时回滚事务而不是提交"""
+        self.aborted = True
     
     def add_rollback_action(self, action: Dict):
-        """添加自定义回滚操作"""
-        transaction_file = self.manager.backup_dir / f'{self.transaction_id}.json'
-        
-        with open(transaction_file) as f:
-            transaction_data = json.load(f)
-        
-        transaction_data['rollback_actions'].append(action)
-        
-        with open(transaction_file, 'w') as f:
-            json.dump(transaction_data, f, indent=2)
\ No newline at end of file
+        """添加自定义回滚操作（追加到事务日志，不改写已有内容）"""
+        self.manager._journal_append(self.transaction_id, {'type': 'action', 'action': action})
+    
+    def prepare_modify(self, path: Path):
+        """声明即将原地修改path，先解除其文件与快照之间的共享"""
+        self.manager.break_snapshot_links(path)
\ No newline at end of file
@@ -0,0 +1,148 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    operation TEXT NOT NULL,
+    status TEXT NOT NULL,
+    pid INTEGER,
+    start_time TEXT NOT NULL,
+    end_time TEXT,
+    snapshot_dir TEXT,
+    snapshot_bytes INTEGER NOT NULL DEFAULT 0,
+    stored_bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_status_start ON transactions (status, start_time);
+CREATE INDEX IF NOT EXISTS idx_transactions_start ON transactions (start_time);
+"""
+
+COLUMNS = ('id', 'operation', 'status', 'pid', 'start_time', 'end_time',
+           'snapshot_dir', 'snapshot_bytes', 'stored_bytes')
+
+# 仍需处理（进行中或回滚中）的事务状态
+ACTIVE_STATUSES = ('active', 'rolling_back')
+
+class TransactionStore:
+    """事务元数据的SQLite索引
+
+    事务日志仍是崩溃恢复的依据；这里保存状态、操作、时间和快照大小，
+    使"最近一次已提交的事务"、历史查询和清理都成为索引查询而不是遍历目录。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            # WAL模式下监控进程读取时不会阻塞CLI的写入
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def record_begin(self, transaction: Dict):
+        """记录新事务（事务开始时调用）"""
+        sizes = self._snapshot_sizes(transaction.get('backups', {}))
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO transactions '
+                '(id, operation, status, pid, start_time, end_time, snapshot_dir, '
+                'snapshot_bytes, stored_bytes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (transaction['id'], transaction['operation'], transaction.get('status', 'active'),
+                 transaction.get('pid'), transaction['start_time'], transaction.get('end_time'),
+                 transaction.get('backups', {}).get('snapshot_dir'),
+                 sizes[0], sizes[1]))
+
+    def update_status(self, transaction_id: str, status: str, end_time: Optional[str] = None):
+        with self.lock, self.conn:
+            self.conn.execute(
+                'UPDATE transactions SET status = ?, end_time = COALESCE(?, end_time) '
+                'WHERE id = ?', (status, end_time, transaction_id))
+
+    def get(self, transaction_id: str) -> Optional[Dict]:
+        rows = self._query('SELECT * FROM transactions WHERE id = ?', (transaction_id,))
+        return rows[0] if rows else None
+
+    def latest(self, status: str = 'committed') -> Optional[Dict]:
+        """指定状态中快照仍在、最近开始的事务（快照已被清理的事务无法用于恢复）"""
+        rows = self._query(
+            'SELECT * FROM transactions WHERE status = ? AND snapshot_dir IS NOT NULL '
+            'ORDER BY start_time DESC LIMIT 1', (status,))
+        return rows[0] if rows else None
+
+    def history(self, limit: int = 20, status: Optional[str] = None) -> List[Dict]:
+        """按开始时间倒序列出事务"""
+        if status:
+            return self._query(
+                'SELECT * FROM transactions WHERE status = ? ORDER BY start_time DESC LIMIT ?',
+                (status, limit))
+        return self._query('SELECT * FROM transactions ORDER BY start_time DESC LIMIT ?',
+                           (limit,))
+
+    def active(self) -> List[Dict]:
+        """进行中或回滚中的事务"""
+        placeholders = ', '.join('?' * len(ACTIVE_STATUSES))
+        return self._query(
+            f'SELECT * FROM transactions WHERE status IN ({placeholders})', ACTIVE_STATUSES)
+
+    def finished_snapshots(self) -> List[Dict]:
+        """已结束（不再需要恢复）且快照仍在的事务，按开始时间倒序"""
+        placeholders = ', '.join('?' * len(ACTIVE_STATUSES))
+        return self._query(
+            f'SELECT * FROM transactions WHERE status NOT IN ({placeholders}) '
+            'AND snapshot_dir IS NOT NULL ORDER BY start_time DESC', ACTIVE_STATUSES)
+
+    def mark_pruned(self, transaction_id: str):
+        """快照已删除，事务记录保留在历史中"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                'UPDATE transactions SET snapshot_dir = NULL, snapshot_bytes = 0, '
+                'stored_bytes = 0 WHERE id = ?', (transaction_id,))
+
+    def delete(self, transaction_id: str):
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,))
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+
+    def rebuild(self, transactions: List[Dict]):
+        """根据事务日志重放的结果重建索引"""
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM transactions')
+        for transaction in transactions:
+            self.record_begin(transaction)
+            snapshot_dir = transaction.get('backups', {}).get('snapshot_dir')
+            if snapshot_dir and not Path(snapshot_dir).exists():
+                self.mark_pruned(transaction['id'])
+
+    def close(self):
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _query(self, sql: str, params=()) -> List[Dict]:
+        """读取也持有锁：监控的防抖定时器线程与主线程共用同一个连接"""
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def _snapshot_sizes(self, backups: Dict):
+        """快照覆盖的字节数，以及本次快照实际新保存的字节数"""
+        snapshot_bytes = stored_bytes = 0
+        for stats in backups.get('cuda_snapshots', {}).values():
+            if stats:
+                snapshot_bytes += stats.get('bytes', 0)
+                stored_bytes += stats.get('stored_bytes', 0)
+        return snapshot_bytes, stored_bytes
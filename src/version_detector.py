@@ -1,7 +1,12 @@
 import subprocess
 import os
 import re
-from typing import Optional, Dict, List
+import json
+import shutil
+from typing import Optional, Dict, List, Tuple
+
+# 进程内共享的版本检测缓存：(路径, 修改时间) -> 版本
+_version_cache: Dict[Tuple[str, int], Optional[str]] = {}
 
 class CudaVersionDetector:
     def __init__(self):
@@ -10,30 +15,125 @@ class CudaVersionDetector:
             '/usr/local/cuda-*',
             '/opt/cuda'
         ]
+        self.cuda_link = '/usr/local/cuda'
     
     def get_current_cuda_version(self) -> Optional[str]:
-        """检测当前激活的CUDA版本"""
+        """检测当前激活的CUDA版本
+
+        优先通过/usr/local/cuda软链接读取工具包自带的version.json/version.txt，
+        找不到时才调用nvcc。结果按(文件路径, 修改时间)缓存，重复调用只需几次stat。
+        """
+        toolkit = os.path.realpath(self.cuda_link)
+        for name in ('version.json', 'version.txt'):
+            version_file = os.path.join(toolkit, name)
+            try:
+                key = (version_file, os.stat(version_file).st_mtime_ns)
+            except OSError:
+                continue
+            if key not in _version_cache:
+                _version_cache[key] = self._major_minor(self.read_version_file(version_file))
+            if _version_cache[key]:
+                return _version_cache[key]
+        
+        return self._get_nvcc_version()
+    
+    def read_toolkit_version(self, toolkit: str) -> Optional[str]:
+        """读取工具包目录中记录的完整版本号（如12.1.105），没有版本文件时返回None"""
+        for name in ('version.json', 'version.txt'):
+            version_file = os.path.join(toolkit, name)
+            if os.path.isfile(version_file):
+                version = self.read_version_file(version_file)
+                if version:
+                    return version
+        return None
+    
+    def read_version_file(self, version_file: str) -> Optional[str]:
+        """解析version.json（CUDA 11.1+）或version.txt（更早的版本）"""
+        try:
+            with open(version_file) as f:
+                content = f.read()
+        except OSError:
+            return None
+        
+        if version_file.endswith('.json'):
+            try:
+                return json.loads(content)['cuda']['version']
+            except (ValueError, KeyError, TypeError):
+                return None
+        
+        match = re.search(r'CUDA Version (\d+\.\d+(?:\.\d+)?)', content)
+        return match.group(1) if match else None
+    
+    def _get_nvcc_version(self) -> Optional[str]:
+        """调用nvcc --version检测版本，按nvcc可执行文件缓存"""
+        nvcc = shutil.which('nvcc')
+        if not nvcc:
+            return None
+        
+        nvcc = os.path.realpath(nvcc)
         try:
-            result = subprocess.run(['nvcc', '--version'], 
+            key = (nvcc, os.stat(nvcc).st_mtime_ns)
+        except OSError:
+            return None
+        
+        if key not in _version_cache:
+            version = None
+            try:
+                result = subprocess.run([nvcc, '--version'], 
+                                      capture_output=True, text=True)
+                if result.returncode == 0:
+                    match = re.search(r'release (\d+\.\d+)', result.stdout)
+                    version = match.group(1) if match else None
+            except OSError:
+                pass
+            _version_cache[key] = version
+        return _version_cache[key]
+    
+    def _major_minor(self, version: Optional[str]) -> Optional[str]:
+        """12.1.105 -> 12.1"""
+        if not version:
+            return None
+        match = re.match(r'(\d+\.\d+)', version)
+        return match.group(1) if match else None
+    
+    def detect_ubuntu_version(self) -> str:
+        """检测Ubuntu版本，映射到下载源支持的发行版标识"""
+        try:
+            result = subprocess.run(['lsb_release', '-rs'], 
                                   capture_output=True, text=True)
             if result.returncode == 0:
-                match = re.search(r'release (\d+\.\d+)', result.stdout)
-                return match.group(1) if match else None
-        except FileNotFoundError:
-            return None
+                version = result.stdout.strip()
+                # 映射到支持的版本
+                if version.startswith('20.'):
+                    return 'ubuntu20'
+                elif version.startswith('22.'):
+                    return 'ubuntu22'
+                else:
+                    print(f"⚠️ 未明确支持的Ubuntu版本 {version}，使用ubuntu22")
+                    return 'ubuntu22'
+        except Exception as e:
+            print(f"⚠️ 检测Ubuntu版本失败: {e}，使用默认ubuntu22")
+        return 'ubuntu22'
+    
+    @staticmethod
+    def is_toolkit_dir(path: str) -> bool:
+        """目录是否为已安装（可切换）的工具包：包含bin/nvcc
+
+        .cuda-X.dlmate-restore等以点开头的临时目录和cuda.backup不算。
+        """
+        name = os.path.basename(os.path.normpath(path))
+        if name.startswith('.') or name.endswith('.backup'):
+            return False
+        return os.path.isdir(path) and os.path.exists(os.path.join(path, 'bin', 'nvcc'))
     
-    def get_installed_cuda_versions(self) -> List[str]:
-        """检测系统中已安装的所有CUDA版本"""
+    def get_installed_cuda_versions(self, refresh: bool = False) -> List[str]:
+        """检测系统中已安装（可切换）的所有CUDA版本，来自持久化的工具包清单"""
+        from .toolkit_inventory import ToolkitInventory
         versions = []
-        for path_pattern in self.cuda_paths:
-            if '*' in path_pattern:
-                import glob
-                for path in glob.glob(path_pattern):
-                    version = self._extract_version_from_path(path)
-                    if version:
-                        versions.append(version)
-            elif os.path.exists(path_pattern):
-                version = self._extract_version_from_path(path_pattern)
+        for toolkit in ToolkitInventory().toolkits(refresh):
+            if toolkit['source'] == 'system':
+                version = self._major_minor(toolkit['version']) or \
+                    self._extract_version_from_path(toolkit['path'])
                 if version:
                     versions.append(version)
         return sorted(set(versions))
@@ -5,15 +5,34 @@ from pathlib import Path
 from typing import Dict, List, Optional
 from .transaction_manager import TransactionManager
 from .downloader import CudaDownloader
+from .download_catalog import DOWNLOAD_URLS
+from .installer_cache import InstallerCache
+from .tree_copy import TreeCopier
+from .chunk_store import ChunkStore
+from .cache_manager import CacheManager
+from .atomic_fs import swap_into_place, move_to_trash, delete_in_background
 from .version_detector import CudaVersionDetector
+from .tracing import span, traced
 
 class CudaVersionManager:
-    def __init__(self):
+    def __init__(self, connections: int = 1, mirror: str = 'official',
+                 install_base: Optional[Path] = None):
         self.cache_dir = Path.home() / '.deeplearningmate' / 'cuda_cache'
-        self.cache_dir.mkdir(parents=True, exist_ok=True)
-        self.install_base = Path('/usr/local')
-        self.transaction_manager = TransactionManager()
+        self.cache_store = ChunkStore(self.cache_dir)
+        self.install_base = Path(install_base or '/usr/local')
         self.detector = CudaVersionDetector()
+        # 当前版本通过安装目录下的cuda软链接判断
+        self.detector.cuda_link = str(self.install_base / 'cuda')
+        self.connections = connections
+        self.mirror = mirror
+        self._transaction_manager = None
+    
+    @property
+    def transaction_manager(self) -> TransactionManager:
+        """首次需要事务时才创建（会注册信号处理和退出钩子），只读操作不产生副作用"""
+        if self._transaction_manager is None:
+            self._transaction_manager = TransactionManager()
+        return self._transaction_manager
     
     def install_cuda_version(self, version: str) -> bool:
         """安装指定版本的CUDA（公共接口）"""
@@ -21,8 +40,27 @@ class CudaVersionManager:
     
     def switch_cuda_version(self, target_version: str) -> bool:
         """安全地切换CUDA版本"""
-        with self.transaction_manager.transaction(f"switch_cuda_{target_version}") as tx:
-            return self._do_switch_cuda_version(target_version, tx)
+        with span('switch_cuda', 'cuda', version=target_version) as current:
+            with self.transaction_manager.transaction(f"switch_cuda_{target_version}",
+                                                      self._paths_to_modify(target_version)) as tx:
+                result = self._do_switch_cuda_version(target_version, tx)
+                if not result:
+                    tx.abort()
+            current.set(ok=result)
+            return result
+    
+    def _paths_to_modify(self, target_version: str) -> List[Path]:
+        """切换/安装操作会修改的系统路径，事务只为这些路径做快照"""
+        cuda_link = self.install_base / 'cuda'
+        paths = [cuda_link, Path.home() / '.bashrc']
+        if cuda_link.is_dir() and not cuda_link.is_symlink():
+            # 真实目录会被移动到cuda.backup
+            paths.append(self.install_base / 'cuda.backup')
+        
+        # 目标版本尚未安装时，安装目录会被创建（或从缓存恢复）
+        if not self._is_version_installed(target_version):
+            paths.append(self.install_base / f'cuda-{target_version}')
+        return paths
     
     def _do_switch_cuda_version(self, target_version: str, tx) -> bool:
         """执行CUDA版本切换"""
@@ -33,7 +71,8 @@ class CudaVersionManager:
         if current_version:
             tx.add_rollback_action({
                 'type': 'restore_cuda_version',
-                'version': current_version
+                'version': current_version,
+                'install_base': str(self.install_base)
             })
         
         # 1. 检查目标版本是否已安装
@@ -60,18 +99,16 @@ class CudaVersionManager:
             ubuntu_version = self._detect_ubuntu_version()
             
             # 下载过程中的检查点
-            downloader = CudaDownloader()
-            installer_path = downloader.download_cuda(version, ubuntu_version, 
-                                                    Path("/tmp"))
+            # 安装包保存在持久化的内容寻址缓存中，回滚时无需删除
+            cache = InstallerCache()
+            downloader = CudaDownloader(connections=self.connections, cache=cache,
+                                        mirror=self.mirror)
+            installer_path = downloader.download_cuda(version, ubuntu_version,
+                                                    cache.staging_dir)
             
             if not installer_path:
                 return False
-            
-            # 添加清理下载文件的回滚操作
-            tx.add_rollback_action({
-                'type': 'cleanup_file',
-                'path': str(installer_path)
-            })
+            self._enforce_cache_limits(version, installers=cache)
             
             # 执行安装
             return self._install_cuda_package(installer_path, version, tx)
@@ -94,6 +131,9 @@ class CudaVersionManager:
                 'path': str(install_dir)
             })
             
+            # 安装程序会原地覆盖已有文件，先与快照解除共享
+            tx.prepare_modify(install_dir)
+            
             # 执行静默安装
             cmd = [
                 'sudo', 'sh', str(installer_path),
@@ -104,7 +144,10 @@ class CudaVersionManager:
             ]
             
             print(f"🚀 执行安装命令: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            with span('run_installer', 'cuda', version=version,
+                      bytes=installer_path.stat().st_size) as current:
+                result = subprocess.run(cmd, capture_output=True, text=True)
+                current.set(returncode=result.returncode)
             
             if result.returncode == 0:
                 print(f"✅ CUDA {version} 安装成功")
@@ -121,22 +164,7 @@ class CudaVersionManager:
     
     def _detect_ubuntu_version(self) -> str:
         """检测Ubuntu版本"""
-        try:
-            result = subprocess.run(['lsb_release', '-rs'], 
-                                  capture_output=True, text=True)
-            if result.returncode == 0:
-                version = result.stdout.strip()
-                # 映射到支持的版本
-                if version.startswith('20.'):
-                    return 'ubuntu20'
-                elif version.startswith('22.'):
-                    return 'ubuntu22'
-                else:
-                    print(f"⚠️ 未明确支持的Ubuntu版本 {version}，使用ubuntu22")
-                    return 'ubuntu22'
-        except Exception as e:
-            print(f"⚠️ 检测Ubuntu版本失败: {e}，使用默认ubuntu22")
-            return 'ubuntu22'
+        return self.detector.detect_ubuntu_version()
     
     def _get_current_version(self) -> Optional[str]:
         """获取当前激活的CUDA版本"""
@@ -144,14 +172,14 @@ class CudaVersionManager:
     
     def _is_version_installed(self, version: str) -> bool:
         """检查版本是否已安装"""
-        cuda_path = self.install_base / f'cuda-{version}'
-        return cuda_path.exists() and (cuda_path / 'bin' / 'nvcc').exists()
+        return self.detector.is_toolkit_dir(str(self.install_base / f'cuda-{version}'))
     
     def _is_version_cached(self, version: str) -> bool:
-        """检查版本是否在缓存中"""
+        """检查版本是否在缓存中（分块存储或旧版的完整目录）"""
         cache_path = self.cache_dir / f'cuda-{version}'
-        return cache_path.exists()
+        return self.cache_store.has(version) or cache_path.exists()
     
+    @traced('activate', 'cuda')
     def _activate_version(self, version: str) -> bool:
         """激活指定版本的CUDA"""
         try:
@@ -164,13 +192,14 @@ class CudaVersionManager:
             cuda_link = self.install_base / 'cuda'
             cuda_target = self.install_base / f'cuda-{version}'
             
-            if cuda_link.is_symlink():
-                cuda_link.unlink()
-            elif cuda_link.exists():
-                # 如果是目录，先备份
-                shutil.move(str(cuda_link), str(cuda_link) + '.backup')
-            
-            cuda_link.symlink_to(cuda_target)
+            with span('update_symlink', 'cuda', target=str(cuda_target)):
+                if cuda_link.is_symlink():
+                    cuda_link.unlink()
+                elif cuda_link.exists():
+                    # 如果是目录，先备份
+                    shutil.move(str(cuda_link), str(cuda_link) + '.backup')
+                
+                cuda_link.symlink_to(cuda_target)
             
             # 更新环境变量
             self._update_environment(version)
@@ -211,6 +240,7 @@ class CudaVersionManager:
         except Exception as e:
             print(f"⚠️ 更新环境变量失败: {e}")
     
+    @traced('update_bashrc', 'cuda')
     def _update_bashrc(self, version: str):
         """更新.bashrc文件"""
         try:
@@ -252,11 +282,29 @@ class CudaVersionManager:
     def _backup_to_cache(self, version: str):
         """备份版本到缓存"""
         source = self.install_base / f'cuda-{version}'
-        target = self.cache_dir / f'cuda-{version}'
         
-        if source.exists() and not target.exists():
+        if source.exists() and not self._is_version_cached(version):
             print(f"💾 备份CUDA {version}到缓存...")
-            shutil.copytree(source, target)
+            # 清单在所有数据块写完后才保存，中断时不会留下不完整的缓存
+            with span('cache_backup', 'cuda', version=version) as current:
+                stats = self.cache_store.store(version, source)
+                current.set(files=stats['files'], bytes=stats['bytes'],
+                            stored_bytes=stats['stored_bytes'])
+            print(f"💾 已缓存 {stats['files']} 个文件, "
+                  f"{stats['bytes'] / (1024 ** 3):.2f} GB, 新增压缩数据 "
+                  f"{stats['stored_bytes'] / (1024 ** 3):.2f} GB, {stats['seconds']}s")
+            self._enforce_cache_limits(version)
+    
+    def _enforce_cache_limits(self, version: str, installers: Optional[InstallerCache] = None):
+        """写入缓存后按auto_cleanup配置淘汰最久未使用的条目
+
+        分块去重使新写入的实际占用只有写完后才知道，因此在写入后统一检查。
+        """
+        with span('cache_enforce', 'cuda') as current:
+            manager = CacheManager(self.cache_store, installers,
+                                   active_version=self._get_current_version())
+            evicted = manager.enforce(protect=[version])
+            current.set(evicted=len(evicted), bytes=sum(entry['freed'] for entry in evicted))
     
     def _restore_from_cache(self, version: str) -> bool:
         """从缓存恢复版本"""
@@ -264,10 +312,20 @@ class CudaVersionManager:
             source = self.cache_dir / f'cuda-{version}'
             target = self.install_base / f'cuda-{version}'
             
-            if target.exists():
-                shutil.rmtree(target)
+            # 在目标旁复制完整后再换入，已有的目录移入回收目录后台删除
+            staged = target.with_name(f'.{target.name}.dlmate-restore')
+            trash = self.install_base / '.dlmate-trash' / f'cache_restore_{os.getpid()}'
+            move_to_trash(staged, trash)
+            with span('cache_restore', 'cuda', version=version) as current:
+                if self.cache_store.has(version):
+                    stats = self.cache_store.restore(version, staged)
+                else:
+                    stats = TreeCopier().copy_tree(source, staged, f'cuda-{version}')
+                swap_into_place(staged, target, trash)
+                current.set(files=stats['files'], bytes=stats['bytes'])
+            delete_in_background([trash])
+            print(f"📦 已恢复 {stats['files']} 个文件, {stats['seconds']}s")
             
-            shutil.copytree(source, target)
             return self._activate_version(version)
             
         except Exception as e:
@@ -276,8 +334,7 @@ class CudaVersionManager:
     
     def list_available_versions(self) -> List[str]:
         """列出所有可用的CUDA版本"""
-        downloader = CudaDownloader()
-        return list(downloader.download_urls.keys())
+        return list(DOWNLOAD_URLS.keys())
     
     def list_installed_versions(self) -> List[str]:
         """列出已安装的CUDA版本"""
@@ -301,8 +358,11 @@ class CudaVersionManager:
                 print(f"✅ 已删除安装目录: {cuda_path}")
             
             # 删除缓存
+            if self.cache_store.has(version):
+                freed = self.cache_store.remove(version)
+                print(f"✅ 已删除缓存: CUDA {version}（释放 {freed / (1024 ** 2):.1f} MB）")
             if cache_path.exists():
-                shutil.rmtree(cache_path)
+                self.cache_store.remove_legacy(version)
                 print(f"✅ 已删除缓存: {cache_path}")
             
             return True
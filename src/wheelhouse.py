@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import fcntl
+import hashlib
+import platform
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional
+from .tracing import span
+
+class Wheelhouse:
+    """按(框架, CUDA版本, Python ABI, 索引参数)划分的本地wheel仓库
+
+    索引参数决定pip实际下载的是哪个构建（如cu118索引与普通PyPI上的torch不同），
+    不同索引下载的wheel分开存放。一组wheel完整下载后写入清单；清单存在且文件齐全时，安装直接使用
+    pip install --no-index --find-links离线完成，不再访问远程索引。
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = root or Path.home() / '.deeplearningmate' / 'wheelhouse'
+        self.pip = [sys.executable, '-m', 'pip']
+
+    @staticmethod
+    def python_abi() -> str:
+        """当前解释器的ABI标识，如 cp311-x86_64"""
+        return f'cp{sys.version_info.major}{sys.version_info.minor}-{platform.machine()}'
+
+    @staticmethod
+    def index_key(index_args: Optional[List[str]] = None) -> str:
+        """索引参数的标识，未指定索引时为default"""
+        if not index_args:
+            return 'default'
+        return 'index-' + hashlib.sha256(' '.join(index_args).encode()).hexdigest()[:12]
+
+    def path(self, framework: str, cuda_version: str, index_args: Optional[List[str]] = None,
+             abi: Optional[str] = None) -> Path:
+        return self.root / framework / f'cu{cuda_version}' / (abi or self.python_abi()) / \
+            self.index_key(index_args)
+
+    def is_complete(self, framework: str, cuda_version: str, packages: List[str],
+                    index_args: Optional[List[str]] = None) -> bool:
+        """仓库中是否有这组依赖从同一索引下载的完整wheel集合"""
+        directory = self.path(framework, cuda_version, index_args)
+        manifest = self._load_manifest(directory)
+        if not manifest or manifest.get('packages') != packages or \
+                manifest.get('index_args') != (index_args or []):
+            return False
+        return all((directory / name).exists() for name in manifest['files'])
+
+    def sync(self, framework: str, cuda_version: str, packages: List[str],
+             index_args: Optional[List[str]] = None) -> bool:
+        """用pip download把这组依赖（含传递依赖）下载到仓库，已下载的文件不会重复下载"""
+        directory = self.path(framework, cuda_version, index_args)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        # 多个进程同时同步同一组wheel时串行进行
+        with open(directory / '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self.is_complete(framework, cuda_version, packages, index_args):
+                return True
+
+            print(f"📥 下载 {framework} (CUDA {cuda_version}) wheel 到本地仓库...")
+            with span('wheel_sync', 'framework', framework=framework,
+                      cuda_version=cuda_version) as current:
+                result = subprocess.run(self.pip + ['download', '--dest', str(directory)] +
+                                        packages + (index_args or []),
+                                        capture_output=True, text=True)
+                if result.returncode != 0:
+                    current.set(ok=False)
+                    print(f"❌ wheel下载失败: {(result.stderr.strip().splitlines() or [''])[-1]}")
+                    return False
+
+                files = [entry for entry in directory.iterdir()
+                         if entry.suffix in ('.whl', '.gz', '.zip')]
+                current.set(files=len(files), bytes=sum(entry.stat().st_size for entry in files))
+
+            self._save_manifest(directory, {
+                'framework': framework,
+                'cuda_version': cuda_version,
+                'abi': self.python_abi(),
+                'packages': packages,
+                'index_args': index_args or [],
+                'files': sorted(entry.name for entry in files),
+                'synced': datetime.now().isoformat()
+            })
+            return True
+
+    def install(self, framework: str, cuda_version: str, packages: List[str],
+                index_args: Optional[List[str]] = None) -> bool:
+        """从仓库离线安装"""
+        directory = self.path(framework, cuda_version, index_args)
+        with span('pip_install', 'framework', offline=True):
+            result = subprocess.run(self.pip + ['install', '--no-index', '--find-links',
+                                                str(directory)] + packages,
+                                    capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"⚠️ 离线安装失败: {(result.stderr.strip().splitlines() or [''])[-1]}")
+        return result.returncode == 0
+
+    def _load_manifest(self, directory: Path) -> Optional[Dict]:
+        try:
+            with open(directory / 'manifest.json') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_manifest(self, directory: Path, manifest: Dict):
+        tmp_file = directory / 'manifest.json.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_file, directory / 'manifest.json')
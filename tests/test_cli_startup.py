@@ -0,0 +1,43 @@
+import os
+import sys
+import subprocess
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 只读命令不应导入的模块：网络、进度条、事务和YAML解析都只在写操作时需要
+HEAVY_MODULES = ('requests', 'tqdm', 'src.transaction_manager', 'yaml')
+
+# src.cli的导入耗时上限（毫秒）
+STARTUP_BUDGET_MS = 100
+
+def _importtime(args, home):
+    """以-X importtime运行，返回 {模块名: 累计导入耗时(微秒)}"""
+    env = dict(os.environ, HOME=str(home))
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+@pytest.mark.parametrize('command', ['list-versions', 'status'])
+def test_read_only_commands_stay_light(command, tmp_path):
+    """只读命令不导入重量级模块，也不在$HOME下创建任何文件"""
+    modules = _importtime(['-m', 'src.cli', command], tmp_path)
+
+    imported = [name for name in HEAVY_MODULES if name in modules]
+    assert not imported, f"{command} 导入了 {imported}"
+    assert list(tmp_path.rglob('*')) == []
+
+def test_cli_import_budget(tmp_path):
+    """导入src.cli的耗时保持在启动预算内"""
+    samples = [_importtime(['-c', 'import src.cli'], tmp_path)['src.cli'] for _ in range(3)]
+    assert min(samples) / 1000 < STARTUP_BUDGET_MS, f"导入耗时 {min(samples) / 1000:.1f} ms"